@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Memory Benchmark for Gena AI
+Turns/sec of the per-turn SQLite writes, one commit per write vs one
+transaction per turn, for each storage profile (file-backed database,
+no engine involved)
+
+Usage: python bench_memory.py [turns]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from memory import Memory, STORAGE_PROFILES
+
+
+def run_turn(memory, i):
+    """The writes Gena.chat does for one turn (with one learned fact)"""
+    memory.increment_interaction_count()
+    memory.add_message('user', f"Remember that item {i} is important")
+    memory.learn_fact(f"item {i}", "important")
+    memory.add_message('assistant', f"Got it! I'll remember that about item {i}.")
+
+
+def bench(db_path, turns, batched, profile):
+    """Run turns against a fresh database, return turns/sec"""
+    memory = Memory(db_path, profile=profile)
+    try:
+        start = time.perf_counter()
+        for i in range(turns):
+            if batched:
+                with memory.transaction():
+                    run_turn(memory, i)
+            else:
+                run_turn(memory, i)
+        elapsed = time.perf_counter() - start
+    finally:
+        memory.close()
+    return turns / elapsed
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    
+    print(f"Turns: {turns} (file-backed SQLite)")
+    for profile in STORAGE_PROFILES:
+        with tempfile.TemporaryDirectory() as tmp:
+            before = bench(Path(tmp) / "before.db", turns, False, profile)
+            after = bench(Path(tmp) / "after.db", turns, True, profile)
+    
+        print(f"\n[{profile} profile]")
+        print(f"Commit per write:      {before:8.1f} turns/sec")
+        print(f"Transaction per turn:  {after:8.1f} turns/sec")
+        print(f"Speedup:               {after / before:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
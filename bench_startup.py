@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark for Gena AI
+How long until the CLI is usable: import time per module (from python
+-X importtime) and wall-clock time until the "You:" prompt appears
+
+Usage: python bench_startup.py [top_n] [--json]
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+HERE = Path(__file__).resolve().parent
+
+# "import time:       self [us] |  cumulative | imported package"
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter with -X importtime
+    
+    Returns:
+        List of (name, self_us, cumulative_us, depth), in import order
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True, check=True
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            times.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return times
+
+
+def time_to_prompt(timeout=30):
+    """Seconds from launching gena_cli.py until it shows the "You:" prompt"""
+    with tempfile.TemporaryDirectory() as workdir:
+        # Run elsewhere so the benchmark's memory.db doesn't touch yours
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, str(HERE / "gena_cli.py")],
+            cwd=workdir, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, env=dict(os.environ, PYTHONUNBUFFERED="1")
+        )
+        output = b""
+        elapsed = None
+        try:
+            while time.perf_counter() - start < timeout:
+                byte = process.stdout.read(1)
+                if not byte:
+                    break
+                output += byte
+                if output.endswith(b"You: "):
+                    elapsed = time.perf_counter() - start
+                    break
+            process.stdin.write(b"exit\n")
+            process.stdin.flush()
+            process.wait(timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        return elapsed
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != "--json"]
+    top_n = int(args[0]) if args else 10
+    
+    results = {}
+    for module in ("gena_cli", "gena"):
+        times = import_times(module)
+        total = next(cumulative for name, _, cumulative, depth in reversed(times)
+                     if name == module and depth == 0)
+        results[f"import_{module}_ms"] = total / 1000
+        if module == "gena":
+            slowest = sorted(times, key=lambda t: t[1], reverse=True)[:top_n]
+    
+    prompt = time_to_prompt()
+    results["time_to_prompt_ms"] = prompt * 1000 if prompt is not None else None
+    
+    if "--json" in sys.argv:
+        print(json.dumps(results))
+        return
+    
+    print(f"import gena_cli:       {results['import_gena_cli_ms']:8.1f} ms")
+    print(f"import gena:           {results['import_gena_ms']:8.1f} ms")
+    if prompt is not None:
+        print(f"Time to prompt:        {results['time_to_prompt_ms']:8.1f} ms")
+    else:
+        print("Time to prompt:        ✗ prompt never appeared")
+    
+    print(f"\n[slowest modules imported by gena, self time]")
+    for name, self_us, cumulative_us, _ in slowest:
+        print(f"{name:<32} {self_us / 1000:8.2f} ms  (cumulative {cumulative_us / 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
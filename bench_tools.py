@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tools Benchmark for Gena AI
+Per-call overhead of execute_python for typical arithmetic snippets:
+the old exec+eval path vs the cached single-pass compile (in-process),
+plus the round trip through a tool worker process
+
+Usage: python bench_tools.py [calls]
+"""
+
+import sys
+import time
+from io import StringIO
+
+from tool_workers import PythonWorkerPool, execute
+
+
+SNIPPETS = [
+    "2 + 2",
+    "240 * 0.15",
+    "round(math.sqrt(1764) / 7, 2)",
+    "x = 12\ny = 30\nx * y",
+    "total = sum(range(100))\nprint(total)",
+]
+
+
+def legacy_execute(code):
+    """execute_python as it was: new globals, exec, then eval the same code"""
+    try:
+        safe_globals = {
+            '__builtins__': {
+                'abs': abs, 'min': min, 'max': max, 'sum': sum,
+                'round': round, 'len': len, 'range': range,
+                'str': str, 'int': int, 'float': float,
+                'list': list, 'dict': dict, 'print': print
+            }
+        }
+        import math
+        safe_globals['math'] = math
+        
+        old_stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            exec_globals = safe_globals.copy()
+            exec(code, exec_globals)
+            output = sys.stdout.getvalue()
+            if output == "":
+                result = eval(code, exec_globals)
+            else:
+                result = output
+            return f"Result: {result}"
+        finally:
+            sys.stdout = old_stdout
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+
+def bench(func, calls):
+    """Microseconds per call of func over all snippets"""
+    start = time.perf_counter()
+    for i in range(calls):
+        func(SNIPPETS[i % len(SNIPPETS)])
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    
+    print(f"Calls: {calls} ({len(SNIPPETS)} snippets, round robin)")
+    legacy = bench(legacy_execute, calls)
+    cached = bench(execute, calls)
+    print(f"\n[in process]")
+    print(f"exec + eval:           {legacy:8.2f} us/call")
+    print(f"Cached single pass:    {cached:8.2f} us/call")
+    print(f"Speedup:               {legacy / cached:8.2f}x")
+    
+    pool = PythonWorkerPool(workers=1)
+    try:
+        pool_calls = min(calls, 2000)
+        worker = bench(pool.run, pool_calls)
+    finally:
+        pool.close()
+    print(f"\n[worker process]")
+    print(f"Round trip:            {worker:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
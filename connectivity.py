@@ -0,0 +1,138 @@
+"""
+Connectivity Monitor for Gena AI
+Tracks whether the network is reachable without blocking the caller
+"""
+
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class ConnectivityMonitor:
+    """
+    Background-refreshed online/offline state
+    
+    Nothing is probed until `online` is first read. That read returns
+    right away (with `initial` until the first probe finishes) and starts
+    a daemon thread that probes the target every `interval` seconds.
+    
+    Targets:
+        "https://www.google.com"  HTTP(S) request; any response means online
+        "localhost:11434"         TCP connect to host:port (e.g. a local
+                                  gateway or proxy on air-gapped hosts)
+        None                      No probing; always offline
+    
+    Usage:
+        monitor = ConnectivityMonitor("http://intranet.local/health", interval=30)
+        gena = Gena(engine, connectivity=monitor)
+    """
+    
+    DEFAULT_TARGET = "https://www.google.com"
+    
+    def __init__(self, target=DEFAULT_TARGET, interval=60, timeout=2, initial=False):
+        """
+        Args:
+            target: URL or host:port to probe (None to never probe)
+            interval: Seconds between probes
+            timeout: Seconds a probe may take
+            initial: State reported before the first probe finishes
+        """
+        self.target = target
+        self.interval = interval
+        self.timeout = timeout
+        self._online = initial if target is not None else False
+        
+        # Stats
+        self.probes = 0
+        self.failures = 0
+        self.last_checked = None
+        
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    @property
+    def online(self):
+        """Last known state (starts the background probe on first use)"""
+        if self._thread is None and self.target is not None:
+            self._start()
+        return self._online
+    
+    def _start(self):
+        """Start the probe thread (once)"""
+        with self._lock:
+            if self._thread is not None or self._stop.is_set():
+                return
+            self._thread = threading.Thread(target=self._run, name="gena-connectivity", daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        """Probe now, then every interval (or when refresh() is called)"""
+        while not self._stop.is_set():
+            self.check()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+    
+    def check(self):
+        """
+        Probe the target now (blocks up to timeout seconds)
+        
+        Returns:
+            True if the target was reachable
+        """
+        if self.target is None:
+            return False
+        
+        online = self._probe()
+        self._online = online
+        self.probes += 1
+        if not online:
+            self.failures += 1
+        self.last_checked = time.time()
+        return online
+    
+    def _probe(self):
+        """One reachability check of the target"""
+        # Imported here, in the probe thread: requests is slow to import
+        # and Gena's startup shouldn't wait for it
+        import requests
+        
+        try:
+            if "://" in self.target:
+                requests.head(self.target, timeout=self.timeout, allow_redirects=False)
+            else:
+                parts = urlsplit(f"//{self.target}")
+                with socket.create_connection((parts.hostname, parts.port or 80), timeout=self.timeout):
+                    pass
+            return True
+        except (requests.RequestException, OSError, ValueError):
+            return False
+    
+    def refresh(self):
+        """Ask the background thread to probe again soon (doesn't block)"""
+        if self._thread is None:
+            if self.target is not None:
+                self._start()
+        else:
+            self._wake.set()
+    
+    def get_stats(self):
+        """Get probe counters"""
+        return {
+            'target': self.target,
+            'online': self._online,
+            'probes': self.probes,
+            'failures': self.failures,
+            'last_checked': self.last_checked
+        }
+    
+    def stop(self, timeout=5):
+        """Stop the probe thread"""
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
@@ -0,0 +1,243 @@
+"""
+Request Batcher for Gena AI
+Coalesces and batches concurrent generate calls in front of an engine
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class BatchingEngine:
+    """
+    Micro-batching wrapper around an engine
+    
+    Concurrent generate() calls are collected for up to `window` seconds
+    (or until the backend's capacity is reached). Identical prompts in a
+    batch are generated once and share the result. The rest is submitted
+    together: as one multi-prompt request when the engine has
+    generate_batch (llama-server spreads it over its slots), otherwise as
+    parallel in-flight requests. Never more than `capacity` prompts are
+    in flight, so requests wait here rather than queue on the server.
+    
+    Everything else (generate_stream, embed, ...) goes straight to the
+    wrapped engine.
+    
+    Usage:
+        engine = BatchingEngine(LlamaCppEngine(...))
+        gena = Gena(engine=engine)
+    """
+    
+    # Upper bound on capacity (worker threads are only started as needed)
+    MAX_CAPACITY = 64
+    # Seconds to send prompts one by one after a prompt batch failed
+    BATCH_COOLDOWN = 300
+    
+    def __init__(self, engine, capacity=None, window=0.01, coalesce=True, refresh_interval=60):
+        """
+        Args:
+            engine: Engine (or EnginePool) to send requests to
+            capacity: Max prompts in flight (default: the engine's parallel
+                      slots if it reports them, else 4)
+            window: Seconds to wait for more requests after the first one
+            coalesce: Share one generation between identical prompts
+            refresh_interval: Seconds between asking the engine for its
+                              slots again (when capacity isn't given)
+        """
+        self.engine = engine
+        # Without a fixed capacity, the engine is asked on the first
+        # dispatch (a deferred or still-loading server can't answer yet)
+        self._fixed_capacity = capacity
+        self.capacity = min(max(1, capacity), self.MAX_CAPACITY) if capacity is not None else None
+        self.refresh_interval = refresh_interval
+        self._capacity_checked = None
+        self.window = window
+        self.coalesce = coalesce
+        self._batch_supported = hasattr(engine, 'generate_batch')
+        self._batch_retry_at = 0.0
+        
+        # Stats
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_prompts = 0
+        
+        self._queue = queue.Queue()
+        self._in_flight = 0
+        self._slots = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.MAX_CAPACITY, thread_name_prefix="gena-batch")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="gena-batcher", daemon=True)
+        self._dispatcher.start()
+    
+    def __getattr__(self, name):
+        # Only called for attributes not defined here
+        if name == 'engine':
+            raise AttributeError(name)
+        return getattr(self.engine, name)
+    
+    # ==================== ENGINE INTERFACE ====================
+    
+    def _submit(self, prompt, raise_errors, kwargs):
+        """Queue a prompt; returns a Future for its response"""
+        future = Future()
+        self._queue.put((prompt, raise_errors, kwargs, future))
+        return future
+    
+    def generate(self, prompt, raise_errors=False, **kwargs):
+        """
+        Generate a response (batched with concurrent calls)
+        
+        Args:
+            prompt: Full prompt with system + context + user message
+            raise_errors: Raise on failure instead of returning an error
+                          message as the response
+            **kwargs: Passed on to the engine (e.g. session_id)
+        
+        Returns:
+            Generated response text
+        """
+        return self._submit(prompt, raise_errors, kwargs).result()
+    
+    async def agenerate(self, prompt, raise_errors=False, **kwargs):
+        """Async version of generate()"""
+        return await asyncio.wrap_future(self._submit(prompt, raise_errors, kwargs))
+    
+    # ==================== DISPATCH ====================
+    
+    def _dispatch_loop(self):
+        """Collect requests into batches and hand them to the workers"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            
+            self._refresh_capacity()
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.capacity:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # Stop after this batch
+                    break
+                batch.append(item)
+            
+            self._dispatch(batch)
+    
+    def _refresh_capacity(self):
+        """Ask the engine for its slots (first dispatch, then every refresh_interval)"""
+        if self._fixed_capacity is not None:
+            return
+        now = time.monotonic()
+        if self._capacity_checked is not None and now - self._capacity_checked < self.refresh_interval:
+            return
+        self._capacity_checked = now
+        
+        try:
+            slots = self.engine.get_parallel_slots() if hasattr(self.engine, 'get_parallel_slots') else 4
+        except Exception:
+            slots = self.capacity or 1  # Engine failed to start; requests report it
+        with self._slots:
+            self.capacity = min(max(1, slots), self.MAX_CAPACITY)
+            self._slots.notify_all()
+    
+    def _acquire_slot(self):
+        """Wait until fewer than capacity prompts are in flight"""
+        with self._slots:
+            while self._in_flight >= self.capacity:
+                self._slots.wait()
+            self._in_flight += 1
+    
+    def _release_slots(self, count):
+        """Mark prompts as done"""
+        with self._slots:
+            self._in_flight -= count
+            self._slots.notify_all()
+    
+    def _dispatch(self, batch):
+        """Group a batch by prompt and submit it within capacity"""
+        # Requests wanting errors raised can't share with ones that don't
+        groups = {}
+        for prompt, raise_errors, kwargs, future in batch:
+            key = (prompt, raise_errors) if self.coalesce else id(future)
+            if key in groups:
+                groups[key][3].append(future)
+                self.coalesced += 1
+            else:
+                groups[key] = (prompt, raise_errors, kwargs, [future])
+        groups = list(groups.values())
+        self.requests += len(batch)
+        
+        # Waiting for free slots here lets the next batch grow meanwhile
+        for _ in groups:
+            self._acquire_slot()
+        
+        if self._batch_supported and len(groups) > 1 and time.monotonic() >= self._batch_retry_at:
+            self.batches += 1
+            self.batched_prompts += len(groups)
+            self._executor.submit(self._run_batch, groups)
+        else:
+            for group in groups:
+                self._executor.submit(self._run_groups, [group])
+    
+    def _run_groups(self, groups):
+        """Generate each group's prompt with its own request"""
+        try:
+            for prompt, raise_errors, kwargs, futures in groups:
+                try:
+                    result = self.engine.generate(prompt, raise_errors=raise_errors, **kwargs)
+                except Exception as e:
+                    for future in futures:
+                        future.set_exception(e)
+                else:
+                    for future in futures:
+                        future.set_result(result)
+        finally:
+            self._release_slots(len(groups))
+    
+    def _run_batch(self, groups):
+        """Generate all groups' prompts with one multi-prompt request"""
+        try:
+            results = self.engine.generate_batch([group[0] for group in groups], raise_errors=True)
+        except Exception:
+            # The server may not take prompt lists, or just had a bad moment
+            # (restart, timeout). Send prompts one by one for a while and
+            # then try batching again; the single requests run in parallel
+            # (with each caller's kwargs) and report errors the way each
+            # caller asked for.
+            self._batch_retry_at = time.monotonic() + self.BATCH_COOLDOWN
+            for group in groups:
+                self._executor.submit(self._run_groups, [group])
+            return
+        
+        for (_, _, _, futures), result in zip(groups, results):
+            for future in futures:
+                future.set_result(result)
+        self._release_slots(len(groups))
+    
+    # ==================== STATS / CLEANUP ====================
+    
+    def get_batch_stats(self):
+        """Get batching counters"""
+        return {
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'batches': self.batches,
+            'avg_batch_size': self.batched_prompts / self.batches if self.batches else 0.0,
+            'capacity': self.capacity
+        }
+    
+    def close(self):
+        """Stop the dispatcher, finish queued requests and close the engine"""
+        self._queue.put(None)
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        if hasattr(self.engine, 'close'):
+            self.engine.close()
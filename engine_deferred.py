@@ -0,0 +1,141 @@
+"""
+Deferred Engine for Gena AI
+Creates and warms up an engine in the background so startup doesn't wait
+"""
+
+import asyncio
+import threading
+import time
+
+
+class DeferredEngine:
+    """
+    Engine built in a background thread
+    
+    The factory (importing the engine module, its constructor, launching
+    llama-server, ...) and the engine's warmup() run while the caller
+    carries on. The first use of the engine waits until they are done;
+    if the factory raised, wait() raises that error and every attribute
+    lookup an AttributeError caused by it (so hasattr() checks are False).
+    
+    Usage:
+        engine = DeferredEngine(lambda: LlamaCppEngine(model_path="model.gguf"))
+        gena = Gena(engine=engine)  # Doesn't wait for the server
+        gena.chat("Hi!")            # Waits for it (once)
+    """
+    
+    def __init__(self, factory, warmup=True):
+        """
+        Args:
+            factory: Function returning the engine
+            warmup: Call the engine's warmup() (if it has one) before it is
+                    considered ready
+        """
+        self._factory = factory
+        self._warmup = warmup
+        self._engine = None
+        self._error = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._abandoned = False
+        self.startup_time = None
+        
+        self._thread = threading.Thread(target=self._start, name="gena-engine-startup", daemon=True)
+        self._thread.start()
+    
+    def _start(self):
+        """Build the engine (runs in the background thread)"""
+        start = time.perf_counter()
+        try:
+            engine = self._factory()
+            if self._warmup and hasattr(engine, 'warmup'):
+                try:
+                    engine.warmup()
+                except Exception:
+                    pass  # Best effort; requests report backend problems
+            self._engine = engine
+        except Exception as e:
+            self._error = e
+        finally:
+            self.startup_time = time.perf_counter() - start
+            with self._lock:
+                self._ready.set()
+                abandoned = self._abandoned
+        
+        if abandoned and self._engine is not None:
+            # Shut down while still starting; clean up now that it's built
+            self._shutdown(self._engine)
+    
+    @property
+    def ready(self):
+        """True once the engine is built (or failed to build)"""
+        return self._ready.is_set()
+    
+    def wait(self, timeout=None):
+        """
+        The engine, once it's ready
+        
+        Raises:
+            TimeoutError: If it isn't ready within timeout seconds
+            Exception: Whatever the factory raised
+        """
+        if not self._ready.wait(timeout):
+            raise TimeoutError("Engine is still starting")
+        if self._error is not None:
+            raise self._error
+        return self._engine
+    
+    def __getattr__(self, name):
+        # Only called for attributes not defined here
+        if name.startswith('_'):
+            raise AttributeError(name)
+        self._ready.wait()
+        if self._error is not None:
+            raise AttributeError(f"Engine failed to start: {self._error}") from self._error
+        return getattr(self._engine, name)
+    
+    # ==================== CLEANUP ====================
+    
+    def _finished_starting(self, timeout):
+        """
+        Wait up to timeout seconds for the startup to finish
+        
+        Returns:
+            True if it finished; if not, the engine is shut down by the
+            startup thread once it's built
+        """
+        if self._abandoned:
+            return False
+        if self._ready.wait(timeout):
+            return True
+        with self._lock:
+            if self._ready.is_set():
+                return True
+            self._abandoned = True
+        return False
+    
+    @staticmethod
+    def _shutdown(engine):
+        """Stop and close an engine nobody is waiting for"""
+        for name in ('stop_server', 'close'):
+            if hasattr(engine, name):
+                try:
+                    getattr(engine, name)()
+                except Exception:
+                    pass
+    
+    def stop_server(self, timeout=10):
+        """Stop the engine's server (waits up to timeout seconds for the startup)"""
+        if self._finished_starting(timeout) and self._engine is not None and hasattr(self._engine, 'stop_server'):
+            self._engine.stop_server()
+    
+    def close(self, timeout=10):
+        """Close the engine (waits up to timeout seconds for the startup)"""
+        if self._finished_starting(timeout) and self._engine is not None and hasattr(self._engine, 'close'):
+            self._engine.close()
+    
+    async def aclose(self, timeout=10):
+        """Async version of close()"""
+        finished = await asyncio.to_thread(self._finished_starting, timeout)
+        if finished and self._engine is not None and hasattr(self._engine, 'aclose'):
+            await self._engine.aclose()
@@ -0,0 +1,77 @@
+"""
+HTTP Helpers for Gena AI Engines
+Shared keep-alive session setup for backend API calls
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def create_session(pool_size=4, max_retries=2, backoff_factor=0.3):
+    """
+    Create a pooled keep-alive HTTP session
+    
+    Connections are reused across generate/health/model calls instead of
+    opening a new TCP connection per request.
+    
+    Args:
+        pool_size: Max pooled connections kept open per host
+        max_retries: Retries for failed connects (any request) and
+                     gateway errors (GET/HEAD only)
+        backoff_factor: Exponential backoff base between retries (seconds)
+    
+    Returns:
+        Configured requests.Session
+    """
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,  # Never re-send a generate the server may already be decoding
+        status=max_retries,
+        status_forcelist=(429, 502, 504),
+        # Status retries for reads only: a gateway error may come after
+        # the backend accepted a generate. Connect errors are retried for
+        # every method, since then nothing reached the server.
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        backoff_factor=backoff_factor,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry
+    )
+    
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def create_async_client(pool_size=4, max_retries=2, timeout=120):
+    """
+    Create a pooled keep-alive async HTTP client (requires httpx)
+    
+    Args:
+        pool_size: Max open connections to the backend
+        max_retries: Retries for failed connects
+        timeout: Read timeout in seconds
+    
+    Returns:
+        httpx.AsyncClient
+    """
+    try:
+        import httpx
+    except ImportError:
+        raise ImportError("Async engines need httpx: pip install httpx")
+    
+    return httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(retries=max_retries),
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size
+        ),
+        # No pool timeout: extra requests wait for a free connection
+        timeout=httpx.Timeout(timeout, pool=None)
+    )
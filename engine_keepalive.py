@@ -0,0 +1,141 @@
+"""
+Keep-Alive Management for Gena AI
+Keeps the Ollama model loaded while it's likely to be used
+"""
+
+import threading
+import time
+from datetime import datetime
+
+
+class KeepAlivePolicy:
+    """
+    Time-dependent keep_alive for Ollama requests
+    
+    During business hours every request asks Ollama to keep the model
+    (and the KV cache of the prompt prefix) loaded for a long time;
+    outside them for a short time, so the memory is given back at night.
+    Pass it as OllamaEngine(keep_alive=...) instead of a fixed value.
+    
+    Usage:
+        policy = KeepAlivePolicy(hours="30m", off_hours="5m", start=8, end=18)
+        engine = OllamaEngine(keep_alive=policy)
+    """
+    
+    def __init__(self, hours="30m", off_hours="5m", start=8, end=18, days=(0, 1, 2, 3, 4)):
+        """
+        Args:
+            hours: keep_alive during business hours ("30m", seconds, or -1
+                   for "until unloaded")
+            off_hours: keep_alive the rest of the time (0 unloads right
+                       after each request)
+            start: First business hour (local time, 0-23)
+            end: Hour business hours end (exclusive)
+            days: Business days (0 = Monday)
+        """
+        self.hours = hours
+        self.off_hours = off_hours
+        self.start = start
+        self.end = end
+        self.days = tuple(days)
+    
+    def in_hours(self, now=None):
+        """Whether now (default: the current local time) is in business hours"""
+        now = now or datetime.now()
+        return now.weekday() in self.days and self.start <= now.hour < self.end
+    
+    def current(self, now=None):
+        """keep_alive value to send right now"""
+        return self.hours if self.in_hours(now) else self.off_hours
+
+
+class ModelHeartbeat:
+    """
+    Keeps the model warm during business hours
+    
+    Every interval seconds in business hours the engine's warmup() is
+    called, which loads the model if Ollama unloaded it (restart, another
+    model pushed it out) and refreshes the prompt-prefix cache. Outside
+    business hours, without a policy, or when the engine sent a request
+    within the last interval (its last_request), nothing is sent: that
+    request kept the model loaded, and a warmup would only replace the
+    conversation's cached prompt with the bare prefix.
+    
+    The interval must be shorter than the business-hours keep_alive.
+    """
+    
+    def __init__(self, engine, policy=None, interval=240):
+        """
+        Args:
+            engine: Engine with a warmup() method (e.g. OllamaEngine)
+            policy: KeepAlivePolicy deciding business hours (default: the
+                    engine's keep_alive if it's a policy, else no beats)
+            interval: Seconds between heartbeats
+        """
+        if policy is None and isinstance(getattr(engine, 'keep_alive', None), KeepAlivePolicy):
+            policy = engine.keep_alive
+        self.engine = engine
+        self.policy = policy
+        self.interval = interval
+        
+        self.beats = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_beat = None
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start the heartbeat in a background thread"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="gena-heartbeat", daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        """Heartbeat loop"""
+        while not self._stop.wait(self.interval):
+            self.beat()
+    
+    def beat(self):
+        """
+        Warm the model now if it's business hours
+        
+        Returns:
+            True if the model was warmed up
+        """
+        if self.policy is None or not self.policy.in_hours():
+            self.skipped += 1
+            return False
+        last = getattr(self.engine, 'last_request', None)
+        if last is not None and time.monotonic() - last < self.interval:
+            self.skipped += 1
+            return False
+        
+        try:
+            warmed = self.engine.warmup()
+        except Exception:
+            # Server down or busy; try again next beat
+            warmed = False
+        if warmed:
+            self.beats += 1
+            self.last_beat = time.time()
+        else:
+            self.errors += 1
+        return warmed
+    
+    def get_stats(self):
+        """Get heartbeat counters"""
+        return {
+            'beats': self.beats,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'last_beat': self.last_beat
+        }
+    
+    def stop(self, timeout=5):
+        """Stop the background thread (waits up to timeout seconds)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -4,10 +4,13 @@ Handles all llama.cpp server interactions and configuration
 """
 
 import requests
+import json
 import subprocess
 import time
 from pathlib import Path
 
+from engine_http import create_session, create_async_client
+
 
 class LlamaCppEngine:
     """llama.cpp backend implementation with full configuration"""
@@ -22,7 +25,12 @@ class LlamaCppEngine:
                  context_size=2048,
                  num_threads=4,
                  timeout=120,
-                 auto_start=True):
+                 auto_start=True,
+                 cache_prompt=True,
+                 slot_id=None,
+                 pool_size=4,
+                 max_retries=2,
+                 backoff_factor=0.3):
         """
         Initialize llama.cpp engine
         
@@ -37,6 +45,12 @@ class LlamaCppEngine:
             num_threads: Number of CPU threads
             timeout: Request timeout
             auto_start: Auto-start server if not running
+            cache_prompt: Reuse the server's KV cache for a matching prompt prefix
+            slot_id: Pin requests to one server slot so its cache is reused
+            pool_size: Keep-alive connections to keep open
+            max_retries: Retries for failed connects (and gateway errors
+                         on GET requests)
+            backoff_factor: Backoff base between retries (seconds)
         """
         self.model_path = Path(model_path) if model_path else None
         self.port = port
@@ -47,8 +61,19 @@ class LlamaCppEngine:
         self.context_size = context_size
         self.num_threads = num_threads
         self.timeout = timeout
+        self.cache_prompt = cache_prompt
+        self.slot_id = slot_id
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.session = create_session(pool_size, max_retries, backoff_factor)
+        self._async_client = None
         self.process = None
         
+        # Prompt cache stats (from server timings)
+        self.cache_requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        
         # Stop sequences
         self.stop_sequences = ["User:", "You:", "\n\n"]
         
@@ -84,11 +109,9 @@ class LlamaCppEngine:
             )
             
             # Wait for server to start
-            for i in range(30):
-                if self.check_available():
-                    print("✓ llama.cpp server ready!")
-                    return True
-                time.sleep(1)
+            if wait_for_server(self.check_available, self.process, timeout=30):
+                print("✓ llama.cpp server ready!")
+                return True
             
             print("✗ Server failed to start")
             return False
@@ -100,46 +123,342 @@ class LlamaCppEngine:
             print(f"✗ Error: {e}")
             return False
     
-    def generate(self, prompt):
+    def _build_payload(self, prompt, stream):
+        """Build the /completion request body"""
+        payload = {
+            "prompt": prompt,
+            "n_predict": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "stop": self.stop_sequences,
+            "stream": stream,
+            "cache_prompt": self.cache_prompt
+        }
+        if self.slot_id is not None:
+            payload["id_slot"] = self.slot_id
+        return payload
+    
+    def _record_cache_stats(self, data):
+        """Track how much of the prompt the server took from its cache"""
+        total = data.get("tokens_evaluated")
+        processed = data.get("timings", {}).get("prompt_n")
+        if not total or processed is None:
+            return
+        
+        # Prompt tokens vs those actually processed this request. Not
+        # tokens_cached: that is the slot's n_past, which also counts
+        # tokens generated by earlier requests.
+        cached = total - processed
+        
+        self.cache_requests += 1
+        self.prompt_tokens += total
+        self.cached_tokens += max(0, min(cached, total))
+    
+    def cache_stats(self):
+        """Get prompt cache statistics"""
+        return {
+            'requests': self.cache_requests,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'hit_rate': self.cached_tokens / self.prompt_tokens if self.prompt_tokens else None
+        }
+    
+    def generate(self, prompt, raise_errors=False):
         """
         Generate response from llama.cpp
         
         Args:
             prompt: Full prompt with system + context + user message
+            raise_errors: Raise on failure instead of returning an error
+                          message as the response
             
         Returns:
             Generated response text
         """
         try:
             # Use completion endpoint (simpler than chat)
-            response = requests.post(
+            response = self.session.post(
                 f"{self.host}/completion",
-                json={
-                    "prompt": prompt,
-                    "n_predict": self.max_tokens,
-                    "temperature": self.temperature,
-                    "top_p": self.top_p,
-                    "stop": self.stop_sequences
-                },
+                json=self._build_payload(prompt, stream=False),
                 timeout=self.timeout
             )
             
             if response.status_code == 200:
-                return response.json().get("content", "").strip()
+                data = response.json()
+                self._record_cache_stats(data)
+                return data.get("content", "").strip()
+            elif raise_errors:
+                raise RuntimeError(f"llama.cpp error {response.status_code}")
             else:
                 return f"llama.cpp error {response.status_code}"
         
         except requests.exceptions.ConnectionError:
+            if raise_errors:
+                raise
             return "Can't connect to llama.cpp! Is the server running?"
         except requests.exceptions.Timeout:
+            if raise_errors:
+                raise
             return "Timeout! Try shorter messages?"
         except Exception as e:
+            if raise_errors:
+                raise
             return f"Error: {str(e)}"
     
+    def generate_batch(self, prompts, raise_errors=False):
+        """
+        Generate responses for several prompts in one request
+        
+        llama-server spreads the prompts over its parallel slots (-np)
+        and decodes them together.
+        
+        Args:
+            prompts: List of full prompts
+            raise_errors: Raise on failure instead of returning an error
+                          message as every response
+        
+        Returns:
+            List of response texts, in prompt order
+        """
+        payload = self._build_payload(list(prompts), stream=False)
+        payload.pop("id_slot", None)  # One slot can't hold them all
+        
+        try:
+            response = self.session.post(
+                f"{self.host}/completion",
+                json=payload,
+                timeout=self.timeout
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"llama.cpp error {response.status_code}")
+            
+            data = response.json()
+            items = data if isinstance(data, list) else [data]
+            if len(items) != len(prompts):
+                raise RuntimeError("llama.cpp server does not support prompt batches")
+            
+            results = []
+            for item in sorted(items, key=lambda item: item.get("index", 0)):
+                self._record_cache_stats(item)
+                results.append(item.get("content", "").strip())
+            return results
+        
+        except Exception as e:
+            if raise_errors:
+                raise
+            return [f"Error: {str(e)}"] * len(prompts)
+    
+    async def agenerate(self, prompt, raise_errors=False):
+        """
+        Async version of generate() (requires httpx)
+        
+        Args:
+            prompt: Full prompt with system + context + user message
+            raise_errors: Raise on failure instead of returning an error
+                          message as the response
+        
+        Returns:
+            Generated response text
+        """
+        import httpx
+        
+        try:
+            response = await self._get_async_client().post(
+                f"{self.host}/completion",
+                json=self._build_payload(prompt, stream=False)
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                self._record_cache_stats(data)
+                return data.get("content", "").strip()
+            elif raise_errors:
+                raise RuntimeError(f"llama.cpp error {response.status_code}")
+            else:
+                return f"llama.cpp error {response.status_code}"
+        
+        except httpx.ConnectError:
+            if raise_errors:
+                raise
+            return "Can't connect to llama.cpp! Is the server running?"
+        except httpx.TimeoutException:
+            if raise_errors:
+                raise
+            return "Timeout! Try shorter messages?"
+        except Exception as e:
+            if raise_errors:
+                raise
+            return f"Error: {str(e)}"
+    
+    def generate_stream(self, prompt, raise_errors=False):
+        """
+        Stream response tokens from llama.cpp as they are generated
+        
+        llama-server sends server-sent events when "stream" is set. Closing
+        the generator (e.g. on Ctrl+C) closes the HTTP connection, which
+        makes the server stop decoding for this request.
+        
+        Args:
+            prompt: Full prompt with system + context + user message
+            raise_errors: Raise on failure instead of yielding an error
+                          message as (part of) the response
+            
+        Yields:
+            Response text chunks
+        """
+        try:
+            response = self.session.post(
+                f"{self.host}/completion",
+                json=self._build_payload(prompt, stream=True),
+                timeout=self.timeout,
+                stream=True
+            )
+        except requests.exceptions.ConnectionError:
+            if raise_errors:
+                raise
+            yield "Can't connect to llama.cpp! Is the server running?"
+            return
+        except requests.exceptions.Timeout:
+            if raise_errors:
+                raise
+            yield "Timeout! Try shorter messages?"
+            return
+        except Exception as e:
+            if raise_errors:
+                raise
+            yield f"Error: {str(e)}"
+            return
+        
+        try:
+            if response.status_code != 200:
+                if raise_errors:
+                    raise RuntimeError(f"llama.cpp error {response.status_code}")
+                yield f"llama.cpp error {response.status_code}"
+                return
+            
+            # text/event-stream comes without a charset; requests would
+            # fall back to ISO-8859-1
+            response.encoding = 'utf-8'
+            started = False
+            for event in iter_sse_events(response.iter_lines(decode_unicode=True)):
+                if event == "[DONE]":
+                    return
+                try:
+                    chunk = json.loads(event)
+                except ValueError:
+                    continue  # Not a JSON event (proxy noise, torn record)
+                if "error" in chunk:
+                    if raise_errors:
+                        raise RuntimeError(f"Error: {chunk['error']}")
+                    yield f"Error: {chunk['error']}"
+                    return
+                
+                text = chunk.get("content", "")
+                if not started:
+                    # Drop leading whitespace like generate() does
+                    text = text.lstrip()
+                    started = bool(text)
+                if text:
+                    yield text
+                
+                if chunk.get("stop"):
+                    self._record_cache_stats(chunk)
+                    return
+        
+        except requests.exceptions.Timeout:
+            if raise_errors:
+                raise
+            yield " [Timeout! Try shorter messages?]"
+        except requests.exceptions.RequestException as e:
+            if raise_errors:
+                raise
+            yield f" [Error: {str(e)}]"
+        finally:
+            response.close()
+    
+    def embed(self, texts):
+        """
+        Get embedding vectors for a batch of texts
+        
+        Needs llama-server started with --embedding.
+        
+        Args:
+            texts: List of strings
+        
+        Returns:
+            List of vectors (lists of floats), one per text
+        """
+        response = self.session.post(
+            f"{self.host}/embedding",
+            json={"content": texts},
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"llama.cpp embed error {response.status_code}")
+        
+        data = response.json()
+        items = data if isinstance(data, list) else [data]
+        items = sorted(items, key=lambda item: item.get("index", 0))
+        
+        vectors = []
+        for item in items:
+            vector = item["embedding"]
+            if vector and isinstance(vector[0], list):
+                # Newer servers nest the pooled vector; without pooling
+                # there is one vector per token, so average them
+                vector = [sum(col) / len(vector) for col in zip(*vector)]
+            vectors.append(vector)
+        return vectors
+    
+    def tokenize(self, text, timeout=5):
+        """
+        Tokenize text with the model's own tokenizer
+        
+        Args:
+            text: Text to tokenize
+            timeout: Seconds to wait (callers fall back to an estimate,
+                     so this is much shorter than the generate timeout)
+        
+        Returns:
+            List of token ids
+        """
+        response = self.session.post(
+            f"{self.host}/tokenize",
+            json={"content": text},
+            timeout=min(timeout, self.timeout)
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"llama.cpp tokenize error {response.status_code}")
+        return response.json()["tokens"]
+    
+    def get_parallel_slots(self):
+        """Requests the server decodes at once (its -np slots)"""
+        try:
+            response = self.session.get(f"{self.host}/props", timeout=2)
+            if response.status_code == 200:
+                return response.json().get("total_slots", 1)
+        except requests.exceptions.RequestException:
+            pass
+        return 1
+    
+    def get_sampling_config(self):
+        """Model and options that decide what a prompt generates"""
+        return {
+            'model': str(self.model_path) if self.model_path else self.host,
+            'temperature': self.temperature,
+            'top_p': self.top_p,
+            'max_tokens': self.max_tokens,
+            'stop': self.stop_sequences
+        }
+    
+    def get_context_limits(self):
+        """Context window size and tokens reserved for the response"""
+        return self.context_size, self.max_tokens
+    
     def check_available(self):
         """Check if llama.cpp server is available"""
         try:
-            response = requests.get(f"{self.host}/health", timeout=1)
+            response = self.session.get(f"{self.host}/health", timeout=1)
             return response.status_code == 200
         except:
             return False
@@ -151,8 +470,87 @@ class LlamaCppEngine:
             self.process.wait()
             print("✓ llama.cpp server stopped")
     
+    def close(self):
+        """Close pooled HTTP connections"""
+        self.session.close()
+    
+    async def aclose(self):
+        """Close the async HTTP client"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+    
+    def _get_async_client(self):
+        """Lazily create the async HTTP client"""
+        if self._async_client is None:
+            self._async_client = create_async_client(
+                self.pool_size, self.max_retries, self.timeout
+            )
+        return self._async_client
+    
     def update_config(self, **kwargs):
         """Update engine configuration dynamically"""
         for key, value in kwargs.items():
             if hasattr(self, key):
                 setattr(self, key, value)
+
+
+def wait_for_server(check, process=None, timeout=30):
+    """
+    Poll until a server is ready
+    
+    Polls quickly at first (a warm model loads in well under a second)
+    and backs off to twice a second.
+    
+    Args:
+        check: Callable returning True once the server is ready
+        process: Server Popen object; stop waiting if it exits
+        timeout: Max seconds to wait
+    
+    Returns:
+        True if ready in time
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        if check():
+            return True
+        if process is not None and process.poll() is not None:
+            return False
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def iter_sse_events(lines):
+    """
+    Incrementally parse a server-sent events stream
+    
+    Args:
+        lines: Iterable of decoded text lines (without line endings)
+    
+    Yields:
+        The data payload of each event (multi-line data joined with newlines)
+    """
+    data = []
+    for line in lines:
+        if line is None:
+            continue
+        if line == "":
+            # Blank line ends the current event
+            if data:
+                yield "\n".join(data)
+                data = []
+            continue
+        if line.startswith(":"):
+            continue  # Comment / keep-alive
+        
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            data.append(value)
+    
+    if data:
+        yield "\n".join(data)
@@ -4,7 +4,12 @@ Handles all Ollama API interactions and configuration
 """
 
 import requests
+import json
 import re
+import time
+
+from engine_http import create_session, create_async_client
+from engine_keepalive import KeepAlivePolicy, ModelHeartbeat
 
 
 class OllamaEngine:
@@ -18,7 +23,14 @@ class OllamaEngine:
                  num_predict=200,
                  num_ctx=2048,
                  num_thread=4,
-                 timeout=120):
+                 timeout=120,
+                 keep_alive="30m",
+                 embed_model=None,
+                 pool_size=4,
+                 max_retries=2,
+                 backoff_factor=0.3,
+                 warmup_prompt=None,
+                 heartbeat_interval=None):
         """
         Initialize Ollama engine
         
@@ -31,6 +43,20 @@ class OllamaEngine:
             num_ctx: Context window size
             num_thread: Number of CPU threads
             timeout: Request timeout in seconds
+            keep_alive: How long Ollama keeps the model (and its prompt
+                        cache) loaded after a request, e.g. "30m" or -1,
+                        or a KeepAlivePolicy varying it by time of day
+            embed_model: Model used by embed() (defaults to model)
+            pool_size: Keep-alive connections to keep open
+            max_retries: Retries for failed connects (and gateway errors
+                         on GET requests)
+            backoff_factor: Backoff base between retries (seconds)
+            warmup_prompt: Prompt prefix warmup() primes (e.g. the system
+                           prompt); Gena.warmup() sets it
+            heartbeat_interval: Seconds between background warmups during
+                                the business hours of a KeepAlivePolicy
+                                keep_alive, started by the first warmup()
+                                (None for no heartbeat)
         """
         self.model = model
         self.host = host
@@ -40,6 +66,24 @@ class OllamaEngine:
         self.num_ctx = num_ctx
         self.num_thread = num_thread
         self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.embed_model = embed_model
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.session = create_session(pool_size, max_retries, backoff_factor)
+        self._async_client = None
+        self.warmup_prompt = warmup_prompt
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat = None
+        self.last_request = None  # time.monotonic() of the last request sent
+        
+        # Warmup stats
+        self.warmups = 0
+        self.last_load_time = None
+        
+        # Prompt evaluation stats (tokens Ollama had to process)
+        self.eval_requests = 0
+        self.prompt_eval_tokens = 0
         
         # Stop sequences to prevent hallucination
         self.stop_sequences = [
@@ -47,57 +91,320 @@ class OllamaEngine:
             "U:", "G:", "Human:", "\nHuman:"
         ]
     
-    def generate(self, prompt):
+    def _build_payload(self, prompt, stream):
+        """Build the /api/generate request body (for a request about to be sent)"""
+        self.last_request = time.monotonic()
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            # Keeping the model loaded lets Ollama reuse the KV cache of
+            # the unchanged prompt prefix on the next request
+            "keep_alive": self.get_keep_alive(),
+            "options": {
+                "temperature": self.temperature,
+                "top_p": self.top_p,
+                "num_predict": self.num_predict,
+                "num_ctx": self.num_ctx,
+                "num_thread": self.num_thread,
+                "stop": self.stop_sequences
+            }
+        }
+    
+    def get_keep_alive(self):
+        """keep_alive value to send with the next request"""
+        if isinstance(self.keep_alive, KeepAlivePolicy):
+            return self.keep_alive.current()
+        return self.keep_alive
+    
+    def warmup(self, prompt=None):
+        """
+        Load the model and prime Ollama's cache with the prompt prefix
+        
+        Sends the prefix with a one-token limit, so the model is loaded
+        (with the same num_ctx as real requests; a different one would
+        reload it) and the prefix's KV cache is ready for the first chat.
+        Also starts the heartbeat if heartbeat_interval is set.
+        
+        Args:
+            prompt: Prefix to prime (default: warmup_prompt; remembered
+                    for later warmups). Empty just loads the model.
+        
+        Returns:
+            True if the model is loaded
+        """
+        if prompt is not None:
+            self.warmup_prompt = prompt
+        
+        payload = self._build_payload(self.warmup_prompt or "", stream=False)
+        payload["options"]["num_predict"] = 1
+        
+        start = time.perf_counter()
+        try:
+            response = self.session.post(f"{self.host}/api/generate", json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            return False
+        if response.status_code != 200:
+            return False
+        
+        self.warmups += 1
+        self.last_load_time = time.perf_counter() - start
+        
+        if self.heartbeat_interval and self.heartbeat is None and isinstance(self.keep_alive, KeepAlivePolicy):
+            self.heartbeat = ModelHeartbeat(self, interval=self.heartbeat_interval)
+            self.heartbeat.start()
+        return True
+    
+    def _record_eval_stats(self, data):
+        """Track prompt tokens Ollama evaluated (cached prefix is skipped)"""
+        if "prompt_eval_count" in data:
+            self.eval_requests += 1
+            self.prompt_eval_tokens += data["prompt_eval_count"]
+    
+    def cache_stats(self):
+        """
+        Get prompt evaluation statistics
+        
+        Ollama does not report how many prompt tokens came from its
+        cache, so only evaluated tokens are counted here.
+        """
+        return {
+            'requests': self.eval_requests,
+            'prompt_eval_tokens': self.prompt_eval_tokens,
+            'hit_rate': None,
+            'warmups': self.warmups,
+            'last_load_time': self.last_load_time,
+            'heartbeat': self.heartbeat.get_stats() if self.heartbeat else None
+        }
+    
+    @staticmethod
+    def clean_response(text):
+        """Clean up any conversation artifacts that slipped through"""
+        text = re.sub(r'\n[UG]:', '', text)  # Remove U: or G: at line starts
+        text = re.sub(r'\s+', ' ', text)  # Normalize whitespace
+        return text.strip()
+    
+    def generate(self, prompt, raise_errors=False):
         """
         Generate response from Ollama
         
         Args:
             prompt: Full prompt with system + context + user message
+            raise_errors: Raise on failure instead of returning an error
+                          message as the response
             
         Returns:
             Generated response text
         """
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.host}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": self.temperature,
-                        "top_p": self.top_p,
-                        "num_predict": self.num_predict,
-                        "num_ctx": self.num_ctx,
-                        "num_thread": self.num_thread,
-                        "stop": self.stop_sequences
-                    }
-                },
+                json=self._build_payload(prompt, stream=False),
                 timeout=self.timeout
             )
             
             if response.status_code == 200:
-                text = response.json().get("response", "").strip()
-                
-                # Clean up any conversation artifacts that slipped through
-                text = re.sub(r'\n[UG]:', '', text)  # Remove U: or G: at line starts
-                text = re.sub(r'\s+', ' ', text)  # Normalize whitespace
-                
-                return text.strip()
+                data = response.json()
+                self._record_eval_stats(data)
+                return self.clean_response(data.get("response", ""))
+            elif raise_errors:
+                raise RuntimeError(f"Hmm, error {response.status_code}...")
             else:
                 return f"Hmm, error {response.status_code}..."
         
         except requests.exceptions.ConnectionError:
+            if raise_errors:
+                raise
             return "Can't connect to Ollama! Is it running? (ollama serve)"
         except requests.exceptions.Timeout:
+            if raise_errors:
+                raise
             return "Timeout! That took too long..."
         except Exception as e:
+            if raise_errors:
+                raise
             return f"Error: {str(e)}"
     
+    async def agenerate(self, prompt, raise_errors=False):
+        """
+        Async version of generate() (requires httpx)
+        
+        Args:
+            prompt: Full prompt with system + context + user message
+            raise_errors: Raise on failure instead of returning an error
+                          message as the response
+        
+        Returns:
+            Generated response text
+        """
+        import httpx
+        
+        try:
+            response = await self._get_async_client().post(
+                f"{self.host}/api/generate",
+                json=self._build_payload(prompt, stream=False)
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                self._record_eval_stats(data)
+                return self.clean_response(data.get("response", ""))
+            elif raise_errors:
+                raise RuntimeError(f"Hmm, error {response.status_code}...")
+            else:
+                return f"Hmm, error {response.status_code}..."
+        
+        except httpx.ConnectError:
+            if raise_errors:
+                raise
+            return "Can't connect to Ollama! Is it running? (ollama serve)"
+        except httpx.TimeoutException:
+            if raise_errors:
+                raise
+            return "Timeout! That took too long..."
+        except Exception as e:
+            if raise_errors:
+                raise
+            return f"Error: {str(e)}"
+    
+    def generate_stream(self, prompt, raise_errors=False):
+        """
+        Stream response tokens from Ollama as they are generated
+        
+        Ollama answers with one JSON object per line (NDJSON); each
+        carries the next piece of text in "response" until "done".
+        Closing the generator closes the HTTP connection.
+        
+        Args:
+            prompt: Full prompt with system + context + user message
+            raise_errors: Raise on failure instead of yielding an error
+                          message as (part of) the response
+            
+        Yields:
+            Response text chunks (raw, not cleaned up)
+        """
+        try:
+            response = self.session.post(
+                f"{self.host}/api/generate",
+                json=self._build_payload(prompt, stream=True),
+                timeout=self.timeout,
+                stream=True
+            )
+        except requests.exceptions.ConnectionError:
+            if raise_errors:
+                raise
+            yield "Can't connect to Ollama! Is it running? (ollama serve)"
+            return
+        except requests.exceptions.Timeout:
+            if raise_errors:
+                raise
+            yield "Timeout! That took too long..."
+            return
+        except Exception as e:
+            if raise_errors:
+                raise
+            yield f"Error: {str(e)}"
+            return
+        
+        try:
+            if response.status_code != 200:
+                if raise_errors:
+                    raise RuntimeError(f"Hmm, error {response.status_code}...")
+                yield f"Hmm, error {response.status_code}..."
+                return
+            
+            started = False
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line)
+                except ValueError:
+                    continue  # Not an NDJSON record (proxy noise, keep-alive)
+                if chunk.get("error"):
+                    if raise_errors:
+                        raise RuntimeError(f"Error: {chunk['error']}")
+                    yield f"Error: {chunk['error']}"
+                    return
+                
+                text = chunk.get("response", "")
+                if not started:
+                    # Drop leading whitespace like generate() does
+                    text = text.lstrip()
+                    started = bool(text)
+                if text:
+                    yield text
+                
+                if chunk.get("done"):
+                    self._record_eval_stats(chunk)
+                    return
+        
+        except requests.exceptions.Timeout:
+            if raise_errors:
+                raise
+            yield " [Timeout! That took too long...]"
+        except requests.exceptions.RequestException as e:
+            if raise_errors:
+                raise
+            yield f" [Error: {str(e)}]"
+        finally:
+            response.close()
+    
+    def embed(self, texts):
+        """
+        Get embedding vectors for a batch of texts
+        
+        Uses /api/embed (one request for the whole batch) and falls back
+        to the older one-text-per-request /api/embeddings.
+        
+        Args:
+            texts: List of strings
+        
+        Returns:
+            List of vectors (lists of floats), one per text
+        """
+        model = self.embed_model or self.model
+        response = self.session.post(
+            f"{self.host}/api/embed",
+            json={"model": model, "input": texts, "keep_alive": self.get_keep_alive()},
+            timeout=self.timeout
+        )
+        if response.status_code == 200:
+            return response.json()["embeddings"]
+        
+        if response.status_code != 404:
+            raise RuntimeError(f"Ollama embed error {response.status_code}")
+        
+        vectors = []
+        for text in texts:
+            response = self.session.post(
+                f"{self.host}/api/embeddings",
+                json={"model": model, "prompt": text, "keep_alive": self.get_keep_alive()},
+                timeout=self.timeout
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama embed error {response.status_code}")
+            vectors.append(response.json()["embedding"])
+        return vectors
+    
+    def get_sampling_config(self):
+        """Model and options that decide what a prompt generates"""
+        return {
+            'model': self.model,
+            'temperature': self.temperature,
+            'top_p': self.top_p,
+            'num_predict': self.num_predict,
+            'num_ctx': self.num_ctx
+        }
+    
+    def get_context_limits(self):
+        """Context window size and tokens reserved for the response"""
+        return self.num_ctx, self.num_predict
+    
     def check_available(self):
         """Check if Ollama server is available"""
         try:
-            response = requests.get(f"{self.host}/api/tags", timeout=2)
+            response = self.session.get(f"{self.host}/api/tags", timeout=2)
             return response.status_code == 200
         except:
             return False
@@ -105,7 +412,7 @@ class OllamaEngine:
     def list_models(self):
         """List available models in Ollama"""
         try:
-            response = requests.get(f"{self.host}/api/tags", timeout=5)
+            response = self.session.get(f"{self.host}/api/tags", timeout=5)
             if response.status_code == 200:
                 models = response.json().get("models", [])
                 return [model["name"] for model in models]
@@ -113,6 +420,27 @@ class OllamaEngine:
         except:
             return []
     
+    def close(self):
+        """Stop the heartbeat and close pooled HTTP connections"""
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+            self.heartbeat = None
+        self.session.close()
+    
+    async def aclose(self):
+        """Close the async HTTP client"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+    
+    def _get_async_client(self):
+        """Lazily create the async HTTP client"""
+        if self._async_client is None:
+            self._async_client = create_async_client(
+                self.pool_size, self.max_retries, self.timeout
+            )
+        return self._async_client
+    
     def update_config(self, **kwargs):
         """Update engine configuration dynamically"""
         for key, value in kwargs.items():
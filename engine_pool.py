@@ -0,0 +1,350 @@
+"""
+Engine Pool for Gena AI
+Load balancing and failover across several backend servers
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+
+
+class EnginePool:
+    """
+    Several engines behind the single-engine interface
+    
+    Requests go to the healthy engine with the fewest requests in flight.
+    A session sticks to the engine that served it last, so that server's
+    KV cache already holds most of its prompt, unless that engine is down
+    or clearly busier than the others. A request that fails is retried on
+    the next engine; an engine that can't be reached is taken out of
+    rotation until a health check (check_available) sees it back.
+    
+    Usage:
+        pool = EnginePool([
+            LlamaCppEngine(port=8080, auto_start=False),
+            LlamaCppEngine(port=8081, auto_start=False),
+        ])
+        gena = Gena(engine=pool)
+    """
+    
+    # Gena passes session_id to the generate calls of engines that set this
+    routes_sessions = True
+    
+    # Sessions whose engine assignment is remembered
+    AFFINITY_SESSIONS = 4096
+    
+    def __init__(self, engines, health_interval=10, affinity_slack=2):
+        """
+        Args:
+            engines: Engines to balance over (OllamaEngine/LlamaCppEngine)
+            health_interval: Seconds between background health checks
+                             (None to only check on check_available())
+            affinity_slack: Extra in-flight requests a session's engine may
+                            have over the least busy one before the session
+                            is moved
+        """
+        self.engines = list(engines)
+        if not self.engines:
+            raise ValueError("EnginePool needs at least one engine")
+        self.health_interval = health_interval
+        self.affinity_slack = affinity_slack
+        
+        count = len(self.engines)
+        self._outstanding = [0] * count
+        self._healthy = [True] * count
+        self._affinity = OrderedDict()  # session_id -> engine index
+        self._lock = threading.Lock()
+        
+        # Stats
+        self.requests = [0] * count
+        self.failures = [0] * count
+        self.failovers = 0
+        
+        self._stop = threading.Event()
+        self._health_thread = None
+        if health_interval:
+            self._health_thread = threading.Thread(
+                target=self._health_loop, name="gena-engine-health", daemon=True
+            )
+            self._health_thread.start()
+    
+    # ==================== ROUTING ====================
+    
+    def _acquire(self, session_id=None, exclude=()):
+        """Pick an engine for a request and count it as in flight"""
+        with self._lock:
+            indexes = [i for i in range(len(self.engines)) if i not in exclude]
+            candidates = [i for i in indexes if self._healthy[i]]
+            if not candidates:
+                # All marked down: still try the rest rather than fail
+                candidates = indexes
+            if not candidates:
+                return None
+            
+            best = min(candidates, key=lambda i: (self._outstanding[i], self.requests[i]))
+            if session_id is not None:
+                pinned = self._affinity.get(session_id)
+                if (pinned in candidates and
+                        self._outstanding[pinned] <= self._outstanding[best] + self.affinity_slack):
+                    best = pinned
+                self._affinity[session_id] = best
+                self._affinity.move_to_end(session_id)
+                while len(self._affinity) > self.AFFINITY_SESSIONS:
+                    self._affinity.popitem(last=False)
+            
+            self._outstanding[best] += 1
+            self.requests[best] += 1
+            return best
+    
+    def _release(self, index, error=None):
+        """Finish a request; a connection failure takes the engine out"""
+        with self._lock:
+            self._outstanding[index] -= 1
+            if error is not None:
+                self.failures[index] += 1
+                # An HTTP error status (RuntimeError) means the server is up
+                if not isinstance(error, RuntimeError):
+                    self._healthy[index] = False
+    
+    def _run(self, call, session_id=None):
+        """Run call(engine) on the best engine, failing over to the others"""
+        tried = []
+        error = None
+        while True:
+            index = self._acquire(session_id, tried)
+            if index is None:
+                raise RuntimeError(f"All engines failed: {error}") from error
+            if tried:
+                self.failovers += 1
+            tried.append(index)
+            
+            try:
+                result = call(self.engines[index])
+            except Exception as e:
+                error = e
+                self._release(index, e)
+                continue
+            self._release(index)
+            return result
+    
+    async def _arun(self, call, session_id=None):
+        """Async version of _run (call returns an awaitable)"""
+        tried = []
+        error = None
+        while True:
+            index = self._acquire(session_id, tried)
+            if index is None:
+                raise RuntimeError(f"All engines failed: {error}") from error
+            if tried:
+                self.failovers += 1
+            tried.append(index)
+            
+            try:
+                result = await call(self.engines[index])
+            except Exception as e:
+                error = e
+                self._release(index, e)
+                continue
+            self._release(index)
+            return result
+    
+    # ==================== ENGINE INTERFACE ====================
+    
+    def generate(self, prompt, raise_errors=False, session_id=None):
+        """
+        Generate a response on the best available engine
+        
+        Args:
+            prompt: Full prompt with system + context + user message
+            raise_errors: Raise if every engine fails instead of returning
+                          an error message as the response
+            session_id: Conversation session (for cache affinity)
+        
+        Returns:
+            Generated response text
+        """
+        try:
+            return self._run(lambda engine: engine.generate(prompt, raise_errors=True), session_id)
+        except Exception:
+            if raise_errors:
+                raise
+            return "Can't reach any backend! Are the servers running?"
+    
+    async def agenerate(self, prompt, raise_errors=False, session_id=None):
+        """Async version of generate()"""
+        def call(engine):
+            if hasattr(engine, 'agenerate'):
+                return engine.agenerate(prompt, raise_errors=True)
+            return asyncio.to_thread(engine.generate, prompt, raise_errors=True)
+        
+        try:
+            return await self._arun(call, session_id)
+        except Exception:
+            if raise_errors:
+                raise
+            return "Can't reach any backend! Are the servers running?"
+    
+    def generate_stream(self, prompt, raise_errors=False, session_id=None):
+        """
+        Stream a response from the best available engine
+        
+        An engine that fails before its first chunk is failed over like in
+        generate(). Once text has been yielded the stream can't move to
+        another engine, so a later error ends it (raised, or appended as
+        " [Error: ...]").
+        """
+        def single(engine):
+            yield engine.generate(prompt, raise_errors=True)
+        
+        tried = []
+        error = None
+        while True:
+            index = self._acquire(session_id, tried)
+            if index is None:
+                if raise_errors:
+                    raise RuntimeError(f"All engines failed: {error}") from error
+                yield "Can't reach any backend! Are the servers running?"
+                return
+            if tried:
+                self.failovers += 1
+            tried.append(index)
+            
+            engine = self.engines[index]
+            if hasattr(engine, 'generate_stream'):
+                stream = engine.generate_stream(prompt, raise_errors=True)
+            else:
+                stream = single(engine)
+            started = False
+            released = False
+            try:
+                for chunk in stream:
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self._release(index, e)
+                released = True
+                if not started:
+                    error = e
+                    continue
+                if raise_errors:
+                    raise
+                yield f" [Error: {e}]"
+            finally:
+                stream.close()
+                if not released:
+                    self._release(index)
+            return
+    
+    def embed(self, texts):
+        """Get embedding vectors for a batch of texts (see engine.embed)"""
+        return self._run(lambda engine: engine.embed(texts))
+    
+    def tokenize(self, text):
+        """Tokenize text (all engines are expected to run the same model)"""
+        for engine in self.engines:
+            if hasattr(engine, 'tokenize'):
+                return engine.tokenize(text)
+        raise RuntimeError("No engine in the pool can tokenize")
+    
+    def clean_response(self, text):
+        """Clean up a response the way the first engine does"""
+        engine = self.engines[0]
+        if hasattr(engine, 'clean_response'):
+            return engine.clean_response(text)
+        return text.strip()
+    
+    def get_sampling_config(self):
+        """Model and sampling options (all engines are expected to match)"""
+        engine = self.engines[0]
+        return engine.get_sampling_config() if hasattr(engine, 'get_sampling_config') else {}
+    
+    def get_context_limits(self):
+        """Smallest context window and response size over all engines"""
+        limits = [engine.get_context_limits() for engine in self.engines
+                  if hasattr(engine, 'get_context_limits')]
+        if not limits:
+            return 2048, 256
+        return min(window for window, _ in limits), max(tokens for _, tokens in limits)
+    
+    def get_parallel_slots(self):
+        """Requests all engines together decode at once"""
+        return sum(engine.get_parallel_slots() if hasattr(engine, 'get_parallel_slots') else 1
+                   for engine in self.engines)
+    
+    # ==================== HEALTH ====================
+    
+    def _health_loop(self):
+        """Background health checks"""
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+    
+    def check_health(self):
+        """
+        Probe every engine with check_available
+        
+        Returns:
+            List of booleans, one per engine
+        """
+        status = [engine.check_available() for engine in self.engines]
+        with self._lock:
+            self._healthy = status
+        return status
+    
+    def check_available(self):
+        """True if at least one engine is available"""
+        return any(self.check_health())
+    
+    def cache_stats(self):
+        """Combined prompt cache statistics of all engines"""
+        stats = [engine.cache_stats() if hasattr(engine, 'cache_stats') else {}
+                 for engine in self.engines]
+        prompt_tokens = sum(s.get('prompt_tokens', 0) for s in stats)
+        cached_tokens = sum(s.get('cached_tokens', 0) for s in stats)
+        return {
+            'requests': sum(s.get('requests', 0) for s in stats),
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'hit_rate': cached_tokens / prompt_tokens if prompt_tokens else None,
+            'engines': stats
+        }
+    
+    def get_stats(self):
+        """Routing statistics per engine"""
+        with self._lock:
+            return {
+                'engines': [
+                    {
+                        'healthy': self._healthy[i],
+                        'outstanding': self._outstanding[i],
+                        'requests': self.requests[i],
+                        'failures': self.failures[i]
+                    }
+                    for i in range(len(self.engines))
+                ],
+                'failovers': self.failovers,
+                'sessions': len(self._affinity)
+            }
+    
+    # ==================== CLEANUP ====================
+    
+    def stop_server(self):
+        """Stop servers started by the engines"""
+        for engine in self.engines:
+            if hasattr(engine, 'stop_server'):
+                engine.stop_server()
+    
+    def close(self):
+        """Stop health checks and close all engines"""
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join(timeout=5)
+            self._health_thread = None
+        for engine in self.engines:
+            if hasattr(engine, 'close'):
+                engine.close()
+    
+    async def aclose(self):
+        """Close the engines' async HTTP clients"""
+        for engine in self.engines:
+            if hasattr(engine, 'aclose'):
+                await engine.aclose()
@@ -3,26 +3,90 @@ Gena AI - Main Coordinator
 Brings together engine, memory, and tools
 """
 
-import requests
-from memory import Memory
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from connectivity import ConnectivityMonitor
+from history_compactor import HistoryCompactor
+from memory import Memory, DEFAULT_SESSION
+from prompt_builder import PromptBuilder
+from tool_parser import ToolCallParser, parse_tool_calls
 from tools import Tools
 
 
+def error_reply(error):
+    """
+    Reply describing a failed generate, worded like the engines' own
+    error messages (for calls made with raise_errors=True)
+    """
+    # By name, so neither requests nor httpx has to be imported here
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & {'Timeout', 'TimeoutException', 'TimeoutError'}:
+        return "Timeout! That took too long..."
+    if names & {'ConnectionError', 'ConnectError'}:
+        return "Can't connect to the engine! Is it running?"
+    if isinstance(error, RuntimeError):
+        return str(error)  # e.g. "Hmm, error 500..."
+    return f"Error: {error}"
+
+
 class Gena:
     """Main Gena AI class - coordinates all components"""
     
-    def __init__(self, engine, memory_db="memory.db"):
+    # Recent messages the response cache key depends on
+    CACHE_KEY_MESSAGES = 4
+    
+    def __init__(self, engine, memory_db="memory.db", session_id=DEFAULT_SESSION, memory=None,
+                 retrieval_k=3, vector_store=None, compact_interval=300, supervisor=None,
+                 response_cache=None, connectivity=None, summary_engine=None):
         """
         Initialize Gena
         
         Args:
             engine: Backend engine (OllamaEngine or LlamaCppEngine)
             memory_db: Path to memory database
+            session_id: Default conversation session (per-call override
+                        with the session_id argument)
+            memory: Existing Memory instance to share instead of opening
+                    memory_db
+            retrieval_k: Facts matching the user's message to put in the
+                         prompt each turn (0 to disable)
+            vector_store: Optional VectorStore for semantic recall of facts
+                          and past messages
+            compact_interval: Seconds between background runs summarizing
+                              old history (None to just drop it per turn)
+            supervisor: Optional LlamaServerSupervisor whose servers are
+                        stopped on shutdown
+            response_cache: Optional ResponseCache reusing answers to
+                            repeated questions (low temperature only)
+            connectivity: ConnectivityMonitor answering `online` (default:
+                          probes ConnectivityMonitor.DEFAULT_TARGET in the
+                          background)
+            summary_engine: Engine summarizing old history (default: engine,
+                            and only while no chat is running); e.g. a
+                            LlamaCppEngine with its own slot_id, so summaries
+                            don't evict the chat slot's cached prefix
         """
         self.engine = engine
-        self.memory = Memory(memory_db)
+        self.memory = memory if memory is not None else Memory(memory_db)
+        self.session_id = session_id
+        self.retrieval_k = retrieval_k
+        self.vector_store = vector_store
+        self.supervisor = supervisor
+        self.response_cache = response_cache
+        if vector_store is not None:
+            self.memory.on_fact_learned = self._index_fact
         self.tools = Tools()
-        self.online = self._check_online()
+        self.prompt_builder = PromptBuilder(engine)
+        self.connectivity = connectivity if connectivity is not None else ConnectivityMonitor()
+        self.summary_engine = summary_engine
+        
+        # Chat turns in progress (see is_idle)
+        self._active_turns = 0
+        self._activity_lock = threading.Lock()
+        self.last_turn_end = None
         
         # System prompt (personality)
         self.system_prompt = """You are Gena, a cute AI assistant!
@@ -31,58 +95,415 @@ Traits: Playful, curious, slightly jealous of other AIs, caring, honest.
 Style: Natural, concise, occasional emojis (sparingly!). Speak normally without quirky symbols like ~.
 Rules: Never make up info. Never simulate the user's responses. Stop after YOUR response only.
 """ + Tools.get_tool_descriptions()
+
+        # Old history is summarized in the background, not deleted per turn
+        self.compactor = None
+        if compact_interval:
+            # Sharing the chat engine, it waits until chats are done
+            idle_fn = None if summary_engine is not None else self.is_idle
+            self.compactor = HistoryCompactor(self.memory, self.summarize_history,
+                                              interval=compact_interval,
+                                              keep_last=self.memory.CONTEXT_HISTORY,
+                                              idle_fn=idle_fn)
+            self.compactor.start()
     
-    def _check_online(self):
-        """Check if internet is available"""
+    @property
+    def online(self):
+        """Whether the network is reachable (last background probe; never blocks)"""
+        return self.connectivity.online
+    
+    def get_prompt_prefix(self):
+        """
+        Static part of every prompt (personality + tools)
+        
+        Must stay byte-identical across turns so the backend can reuse its
+        KV cache for it; anything that changes per turn goes after it.
+        """
+        return f"{self.system_prompt}\n"
+    
+    def warmup(self):
+        """
+        Load the model and prime the backend's cache with the prompt prefix
+        
+        Blocks until the engine answers; the first chat then starts from
+        a loaded model with the personality + tools already evaluated.
+        
+        Returns:
+            True if the engine warmed up (False if it can't or failed)
+        """
+        if not hasattr(self.engine, 'warmup'):
+            return False
         try:
-            requests.get("https://www.google.com", timeout=2)
-            return True
-        except:
+            return self.engine.warmup(self.get_prompt_prefix()) is not False
+        except Exception:
             return False
     
-    def get_full_prompt(self, user_message):
-        """Build complete prompt with system + memory + user message"""
-        context = self.memory.get_context_summary()
-        context += f"Online: {'Yes' if self.online else 'No'}\n"
+    def get_full_prompt(self, user_message, session_id=None):
+        """
+        Build complete prompt with system + memory + user message
+        
+        Packed to the engine's context window by the prompt builder:
+        memory sections in priority order, then as much recent history
+        as still fits.
+        """
+        session_id = session_id or self.session_id
+        return self._build_prompt(user_message, session_id)[0]
+    
+    def _build_prompt(self, user_message, session_id):
+        """Full prompt, and the retrieved memory that went into it"""
+        relevant = self.get_relevant_memory(user_message, session_id)
+        sections = [
+            self.memory.get_context_summary(session_id, recent=0),
+            relevant,
+            self.memory.get_summary_context(session_id),
+            f"Online: {'Yes' if self.online else 'No'}\n"
+        ]
+        history = self.memory.get_recent_lines(session_id)
+        
+        prompt = self.prompt_builder.build(self.get_prompt_prefix(), user_message, sections, history)
+        return prompt, relevant
+    
+    def get_relevant_memory(self, user_message, session_id=None):
+        """Facts and procedures matching the user's message, for the prompt"""
+        if not self.retrieval_k:
+            return ""
+        
+        session_id = session_id or self.session_id
+        context = ""
+        facts = self.memory.search_facts(user_message, self.retrieval_k, session_id)
+        if facts:
+            context += "Relevant facts:\n"
+            for topic, content in facts:
+                context += f"- {topic}: {content}\n"
+        
+        for name, steps in self.memory.search_procedures(user_message, limit=1):
+            context += f"How to {name}: {'; '.join(str(step) for step in steps)}\n"
+        
+        if self.vector_store is not None:
+            shown = {f"{topic}: {content}" for topic, content in facts}
+            try:
+                found = self.vector_store.search(user_message, self.retrieval_k, session_id)
+            except Exception:
+                # Embedding endpoint down: the keyword matches above still work
+                found = []
+            related = [item['text'] for score, item in found if item['text'] not in shown]
+            if related:
+                context += "Related memories:\n"
+                for text in related:
+                    context += f"- {text}\n"
+        
+        return context
+    
+    def summarize_history(self, messages):
+        """
+        Summarize old messages with the engine (for the history compactor)
+        
+        Args:
+            messages: List of (id, timestamp, role, message) rows
+        
+        Returns:
+            Summary text
+        """
+        # Long messages are cut so the batch fits a small context window
+        lines = "".join(
+            f"{'User' if role == 'user' else 'Gena'}: {message[:300]}\n"
+            for _, _, role, message in messages
+        )
+        prompt = (
+            "Summarize this conversation in one or two short sentences. "
+            "Keep names, facts and decisions.\n\n"
+            f"{lines}\nSummary:"
+        )
+        engine = self.summary_engine if self.summary_engine is not None else self.engine
+        return engine.generate(prompt, raise_errors=True).strip()
+    
+    @contextmanager
+    def _active_turn(self):
+        """Mark a chat turn as running (for is_idle)"""
+        with self._activity_lock:
+            self._active_turns += 1
+        try:
+            yield
+        finally:
+            with self._activity_lock:
+                self._active_turns -= 1
+                self.last_turn_end = time.monotonic()
+    
+    def is_idle(self, quiet=5):
+        """
+        Whether no chat turn is running, nor ended in the last quiet seconds
         
-        full_prompt = f"{self.system_prompt}\n{context}\n\nUser: {user_message}\nGena:"
-        return full_prompt
+        Background work on the chat engine (history summaries) waits for
+        this, so it neither slows down a reply nor replaces the backend's
+        cached prompt prefix in the middle of a conversation.
+        """
+        with self._activity_lock:
+            if self._active_turns:
+                return False
+            return self.last_turn_end is None or time.monotonic() - self.last_turn_end >= quiet
+    
+    def _index_fact(self, session_id, topic, content):
+        """Add a learned fact to the vector store"""
+        # Runs inside the turn's transaction: queue only, embed later
+        self.vector_store.add('fact', f"{topic}: {content}", session_id, key=topic, auto_flush=False)
     
-    def chat(self, user_message):
+    def chat(self, user_message, stream=False, session_id=None):
         """
         Main chat interface
         
         Args:
             user_message: User's message
+            stream: If True, return a generator yielding response chunks
+                    as the engine produces them
+            session_id: Conversation session (defaults to self.session_id)
             
         Returns:
-            Gena's response
+            Gena's response (or a chunk generator when stream=True)
         """
-        # Increment interaction count
-        self.memory.increment_interaction_count()
+        session_id = session_id or self.session_id
+        if stream:
+            return self._chat_stream(user_message, session_id)
         
-        # Save user message
-        self.memory.add_message('user', user_message)
-        
-        # Build prompt and generate
-        prompt = self.get_full_prompt(user_message)
-        response = self.engine.generate(prompt)
+        with self._active_turn():
+            prompt, cache_key = self._begin_turn(user_message, session_id)
+            response = self._generate(prompt, cache_key, session_id)
+            
+            response, results = self._finish_turn(user_message, response, session_id)
+        if results:
+            response = (response + "\n" + "\n".join(results)).strip()
+        return response
+    
+    def _chat_stream(self, user_message, session_id):
+        """
+        Streaming variant of chat()
         
-        # Process any tool calls
-        response = self.tools.process_tool_calls(
-            response, 
+        Tool calls are cut out of the stream. Side-effect-free ones
+        (execute_python) run as soon as their closing parenthesis arrives,
+        while the engine keeps generating; the ones writing memory run
+        with the turn's other writes once the stream is complete. Tool
+        results are yielded as a final chunk. If the consumer stops early
+        the engine stream is closed and the partial response is saved,
+        without running the memory-writing calls.
+        """
+        with self._active_turn():
+            prompt, cache_key = self._begin_turn(user_message, session_id)
+            
+            if cache_key is None:
+                chunks = self._engine_stream(prompt, session_id)
+            else:
+                chunks = self._cached_stream(prompt, cache_key, session_id)
+            
+            parser = ToolCallParser()
+            parts = []
+            tool_calls = []
+            finished = False
+            try:
+                for chunk in chunks:
+                    text, calls = parser.feed(chunk)
+                    tool_calls.extend(self._run_early_tools(calls, session_id))
+                    if text:
+                        parts.append(text)
+                        yield text
+                
+                text, calls = parser.close()
+                tool_calls.extend(self._run_early_tools(calls, session_id))
+                if text:
+                    parts.append(text)
+                    yield text
+                finished = True
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+                if not finished:
+                    # Aborted or failed: keep what was said, don't learn from it
+                    self._finish_turn(user_message, "".join(parts), session_id,
+                                      tool_calls=tool_calls, write_tools=False)
+            
+            _, results = self._finish_turn(user_message, "".join(parts), session_id, tool_calls=tool_calls)
+        if results:
+            yield "\n" + "\n".join(results)
+    
+    def _run_tool(self, call, session_id):
+        """Result of one parsed tool call (None if it couldn't run)"""
+        return self.tools.run_tool_call(
+            call,
             self.memory,
-            callback_map={}  # Add custom tool callbacks here if needed
+            callback_map={},  # Add custom tool callbacks here if needed
+            session_id=session_id
         )
+    
+    def _run_early_tools(self, calls, session_id):
+        """
+        Run the side-effect-free tool calls right away
         
-        # Save Gena's response
-        self.memory.add_message('assistant', response)
-        
-        # Clean up old conversations
-        self.memory.clear_old_conversations(keep_last=20)
+        Returns:
+            List of (call, result) pairs; result is None for calls that
+            write memory, which _finish_turn runs in its transaction
+        """
+        return [
+            (call, self._run_tool(call, session_id) if Tools.is_side_effect_free(call) else None)
+            for call in calls
+        ]
+    
+    def _finish_tools(self, tool_calls, session_id, write_tools=True):
+        """
+        Results of a turn's tool calls, in order, running the ones that
+        were held back (inside the turn's transaction)
+        """
+        results = []
+        for call, result in tool_calls:
+            if write_tools and not Tools.is_side_effect_free(call):
+                result = self._run_tool(call, session_id)
+            if result is not None:
+                results.append(result)
+        return results
+    
+    def _engine_kwargs(self, session_id, raise_errors=False):
+        """Extra generate arguments (session routing for EnginePool, errors)"""
+        kwargs = {}
+        if getattr(self.engine, 'routes_sessions', False):
+            kwargs['session_id'] = session_id
+        if raise_errors:
+            kwargs['raise_errors'] = True
+        return kwargs
+    
+    def _generate(self, prompt, cache_key, session_id):
+        """Engine response, from the response cache when possible"""
+        if cache_key is None:
+            return self.engine.generate(prompt, **self._engine_kwargs(session_id))
         
+        response = self.response_cache.get(cache_key)
+        if response is None:
+            try:
+                response = self.engine.generate(prompt, **self._engine_kwargs(session_id, raise_errors=True))
+            except Exception as e:
+                # Not cached; generating again would only fail (or decode) twice
+                return error_reply(e)
+            self.response_cache.put(cache_key, response)
         return response
     
+    def _engine_stream(self, prompt, session_id, raise_errors=False):
+        """Engine response chunks"""
+        kwargs = self._engine_kwargs(session_id, raise_errors)
+        if hasattr(self.engine, 'generate_stream'):
+            return self.engine.generate_stream(prompt, **kwargs)
+        return iter([self.engine.generate(prompt, **kwargs)])
+    
+    def _cached_stream(self, prompt, cache_key, session_id):
+        """Response chunks for a cacheable turn; caches a complete response"""
+        response = self.response_cache.get(cache_key)
+        if response is not None:
+            yield response
+            return
+        
+        parts = []
+        chunks = self._engine_stream(prompt, session_id, raise_errors=True)
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            yield f" [Error: {e}]" if parts else error_reply(e)
+            return
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        
+        self.response_cache.put(cache_key, "".join(parts))
+    
+    def _begin_turn(self, user_message, session_id):
+        """
+        Build the prompt for this turn
+        
+        Nothing is written here; the turn is persisted by _finish_turn
+        once the response is known, so no write lock is held while the
+        engine is generating.
+        
+        Returns:
+            Tuple of (prompt, response cache key or None)
+        """
+        prompt, relevant = self._build_prompt(user_message, session_id)
+        return prompt, self._response_cache_key(user_message, relevant, session_id)
+    
+    def _response_cache_key(self, user_message, relevant, session_id):
+        """
+        Response cache key for this turn, or None if it isn't cached
+        
+        Covers what the answer depends on: personality, the user's info,
+        the retrieved memory, the last CACHE_KEY_MESSAGES messages and the
+        message itself. Counters and timestamps change every turn and are
+        left out. With the recent messages in the key, a follow-up like
+        "yes" only hits after the same exchange.
+        """
+        if self.response_cache is None:
+            return None
+        config = self.engine.get_sampling_config() if hasattr(self.engine, 'get_sampling_config') else {}
+        if not self.response_cache.is_cacheable(config):
+            return None
+        
+        user_info = json.dumps(self.memory.get_user_info(session_id=session_id), sort_keys=True)
+        recent = self.memory.get_recent_conversations(self.CACHE_KEY_MESSAGES, session_id)
+        history = json.dumps([(role, message) for _, role, message in recent])
+        return self.response_cache.make_key(config, (
+            f"{self.get_prompt_prefix()}User info: {user_info}\n{relevant}"
+            f"Online: {self.online}\n{history}\nUser: {user_message}"
+        ))
+    
+    def _finish_turn(self, user_message, response, session_id, tool_calls=None, write_tools=True):
+        """
+        Run tool calls and persist the whole turn in one transaction
+        
+        Side-effect-free tool calls (execute_python, up to seconds) run
+        before the transaction, so the write lock is only held for the
+        writes themselves.
+        
+        Args:
+            tool_calls: (call, result) pairs from _run_early_tools
+                        (streamed turns, whose text has no tool calls left);
+                        None to parse the response for them here
+            write_tools: Run the memory-writing tool calls (False for an
+                         aborted stream)
+        
+        Returns:
+            Tuple of (response with tool calls removed, list of tool results)
+        """
+        if hasattr(self.engine, 'clean_response'):
+            response = self.engine.clean_response(response)
+        else:
+            response = response.strip()
+        
+        if tool_calls is None:
+            text, calls = parse_tool_calls(response)
+            if calls:
+                response = text.strip()
+            tool_calls = self._run_early_tools(calls, session_id)
+        
+        # One commit for the whole turn instead of one per write
+        with self.memory.transaction():
+            # Increment interaction count
+            self.memory.increment_interaction_count(session_id)
+        
+            # Save user message
+            self.memory.add_message('user', user_message, session_id)
+        
+            # Memory-writing tool calls
+            results = self._finish_tools(tool_calls, session_id, write_tools)
+            
+            # Save Gena's response (with tool results, like chat() returns it)
+            saved = "\n".join([response] + results).strip()
+            self.memory.add_message('assistant', saved, session_id)
+            
+            # Without a compactor, drop old history right away
+            if self.compactor is None:
+                self.memory.clear_old_conversations(keep_last=20, session_id=session_id)
+        
+        # Embedded in batches by the store, not on every turn
+        if self.vector_store is not None:
+            self.vector_store.add('message', f"User: {user_message}", session_id)
+            self.vector_store.add('message', f"Gena: {saved}", session_id)
+        
+        return response, results
+    
     # ==================== CORE FEATURES ====================
     
     def teach_procedure(self, name, steps):
@@ -117,29 +538,51 @@ Rules: Never make up info. Never simulate the user's responses. Stop after YOUR
         """Get list of all learned procedures"""
         return self.memory.get_procedures_list()
     
-    def get_greeting(self):
+    def get_greeting(self, session_id=None):
         """Get appropriate greeting based on interaction count"""
-        count = int(self.memory.get_metadata('interaction_count'))
+        count = self.memory.get_interaction_count(session_id or self.session_id)
         if count == 0:
             return "Hiii! I'm Gena! What should I call you?"
         else:
             return f"Welcome back! We've chatted {count} times before!"
     
-    def get_stats(self):
+    def get_stats(self, session_id=None):
         """Get memory statistics"""
+        session_id = session_id or self.session_id
         return {
-            'interaction_count': self.memory.get_metadata('interaction_count'),
-            'facts_count': self.memory.get_facts_count(),
+            'interaction_count': self.memory.get_interaction_count(session_id),
+            'facts_count': self.memory.get_facts_count(session_id),
             'procedures': self.memory.get_procedures_list(),
-            'online': self.online
+            'online': self.online,
+            'connectivity': self.connectivity.get_stats(),
+            'context_cache': self.memory.get_context_cache_stats(),
+            'prompt_usage': self.prompt_builder.last_usage,
+            'history_compactor': self.compactor.get_stats() if self.compactor else None,
+            'response_cache': self.response_cache.get_stats() if self.response_cache else None,
+            # A DeferredEngine that's still starting isn't waited for
+            'engine_cache': (self.engine.cache_stats()
+                             if getattr(self.engine, 'ready', True) and hasattr(self.engine, 'cache_stats')
+                             else None)
         }
     
-    def export_memory(self):
+    def export_memory(self, session_id=None):
         """Export all memory as dict"""
-        return self.memory.export_all()
+        return self.memory.export_all(session_id or self.session_id)
     
     def shutdown(self):
         """Clean shutdown"""
+        if self.compactor is not None:
+            self.compactor.stop()
+        self.connectivity.stop()
+        if self.vector_store is not None:
+            self.vector_store.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        self.tools.shutdown()
         self.memory.close()
         if hasattr(self.engine, 'stop_server'):
             self.engine.stop_server()
+        if hasattr(self.engine, 'close'):
+            self.engine.close()
+        if self.supervisor is not None:
+            self.supervisor.stop()
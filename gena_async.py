@@ -0,0 +1,129 @@
+"""
+Gena AI - Async Coordinator
+Serves many conversations concurrently from one process
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from gena import Gena, error_reply
+
+
+class AsyncGena:
+    """
+    asyncio front-end for Gena
+    
+    Engine calls go through the engine's async HTTP client (agenerate),
+    while memory and tool work runs on a small pool of database threads
+    so the event loop never blocks on SQLite. At most max_concurrency
+    generate calls are in flight against the backend at once.
+    
+    Usage:
+        async with AsyncGena(engine, response_cache=ResponseCache()) as gena:
+            replies = await asyncio.gather(*(gena.chat(m) for m in messages))
+    """
+    
+    def __init__(self, engine, memory_db="memory.db", max_concurrency=8, db_workers=4, **gena_options):
+        """
+        Args:
+            engine: Backend engine (OllamaEngine or LlamaCppEngine)
+            memory_db: Path to memory database
+            max_concurrency: Max generate requests in flight at once
+            db_workers: Threads running memory/tool work
+            **gena_options: Passed on to Gena (response_cache,
+                            vector_store, retrieval_k, ...)
+        """
+        self.engine = engine
+        self.memory_db = memory_db
+        self.gena_options = gena_options
+        self.max_concurrency = max_concurrency
+        self.gena = None
+        self._semaphore = None
+        
+        # Memory keeps one connection per thread; with WAL the readers
+        # building prompts don't wait behind a turn being committed
+        self._db_executor = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix="gena-db")
+    
+    async def start(self):
+        """Open memory and get ready to chat"""
+        self.gena = await self._run_db(partial(Gena, self.engine, self.memory_db, **self.gena_options))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+    
+    async def __aenter__(self):
+        return await self.start()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.shutdown()
+    
+    async def _run_db(self, func, *args):
+        """Run a blocking memory/tool call on a database thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._db_executor, func, *args)
+    
+    async def _generate(self, prompt, session_id, raise_errors=False):
+        """Generate with the engine's async client, or a worker thread"""
+        kwargs = self.gena._engine_kwargs(session_id, raise_errors)
+        if hasattr(self.engine, 'agenerate'):
+            return await self.engine.agenerate(prompt, **kwargs)
+        return await asyncio.to_thread(self.engine.generate, prompt, **kwargs)
+    
+    async def _generate_cached(self, prompt, cache_key, session_id):
+        """Engine response, from the response cache when possible"""
+        cache = self.gena.response_cache
+        if cache_key is not None:
+            # The cache may be on disk (SQLite); keep it off the event loop
+            response = await asyncio.to_thread(cache.get, cache_key)
+            if response is not None:
+                return response
+        
+        async with self._semaphore:
+            if cache_key is None:
+                return await self._generate(prompt, session_id)
+            try:
+                response = await self._generate(prompt, session_id, raise_errors=True)
+            except Exception as e:
+                # Not cached; generating again would only fail (or decode) twice
+                return error_reply(e)
+        await asyncio.to_thread(cache.put, cache_key, response)
+        return response
+    
+    async def chat(self, user_message, session_id=None):
+        """
+        Async chat interface
+        
+        Args:
+            user_message: User's message
+            session_id: Conversation session (defaults to the Gena default)
+        
+        Returns:
+            Gena's response
+        """
+        session_id = session_id or self.gena.session_id
+        with self.gena._active_turn():
+            prompt, cache_key = await self._run_db(self.gena._begin_turn, user_message, session_id)
+            response = await self._generate_cached(prompt, cache_key, session_id)
+            
+            response, results = await self._run_db(
+                self.gena._finish_turn, user_message, response, session_id
+            )
+        if results:
+            response = (response + "\n" + "\n".join(results)).strip()
+        return response
+    
+    async def get_greeting(self, session_id=None):
+        """Get appropriate greeting based on interaction count"""
+        return await self._run_db(self.gena.get_greeting, session_id)
+    
+    async def get_stats(self, session_id=None):
+        """Get memory statistics"""
+        return await self._run_db(self.gena.get_stats, session_id)
+    
+    async def shutdown(self):
+        """Clean shutdown"""
+        if hasattr(self.engine, 'aclose'):
+            await self.engine.aclose()
+        if self.gena:
+            await self._run_db(self.gena.shutdown)
+        self._db_executor.shutdown(wait=True)
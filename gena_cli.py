@@ -6,18 +6,28 @@ Pure text interface - no core logic here!
 
 import sys
 import json
-from gena import Gena
+import threading
+
+# Gena and the engine modules are imported in main(), after the banner
+# is up: requests alone takes ~0.1s to import
+
 
 # ==================== ENGINE CONFIGURATION ====================
 
-from engine_ollama import OllamaEngine
-engine = OllamaEngine(
-    model="qwen2.5:0.5b-instruct",
-    temperature=0.8,
-    num_predict=200,
-    num_ctx=2048,
-    num_thread=4
-)
+def create_engine():
+    """Backend engine (built in the background while the CLI starts)"""
+    from engine_ollama import OllamaEngine
+    # from engine_keepalive import KeepAlivePolicy
+    return OllamaEngine(
+        model="qwen2.5:0.5b-instruct",
+        temperature=0.8,
+        num_predict=200,
+        num_ctx=2048,
+        num_thread=4,
+        # Keep the model loaded all workday, let it go at night
+        # keep_alive=KeepAlivePolicy(hours="30m", off_hours="5m", start=8, end=18),
+        # heartbeat_interval=240
+    )
 
 # ==============================================================
 
@@ -30,9 +40,18 @@ def main():
     print("\nCommands: exit, memory, online, teach, recall <n>, stats, help")
     print("-" * 60)
     
+    # The engine is created (or its server launched) in the background;
+    # the first chat waits for it
+    from engine_deferred import DeferredEngine
+    engine = DeferredEngine(create_engine, warmup=False)
+    
     # Initialize Gena
+    from gena import Gena
     gena = Gena(engine=engine)
     
+    # Load the model with Gena's prompt prefix while the user types
+    threading.Thread(target=gena.warmup, name="gena-warmup", daemon=True).start()
+    
     # Greeting
     print(f"\nGena: {gena.get_greeting()}\n")
     
@@ -59,6 +78,7 @@ def main():
                 
                 # Online
                 if cmd == 'online':
+                    gena.connectivity.check()
                     print(f"\nGena: I'm {'online ✓' if gena.online else 'offline ✗'}!\n")
                     continue
                 
@@ -70,6 +90,9 @@ def main():
                     print(f"Facts: {stats['facts_count']}")
                     print(f"Procedures: {', '.join(stats['procedures']) if stats['procedures'] else 'none'}")
                     print(f"Online: {'✓' if stats['online'] else '✗'}")
+                    engine_cache = stats['engine_cache']
+                    if engine_cache and engine_cache.get('hit_rate') is not None:
+                        print(f"Prompt tokens cached: {engine_cache['hit_rate']:.0%}")
                     print("=" * 60 + "\n")
                     continue
                 
@@ -114,9 +137,20 @@ def main():
                         print(f"\nGena: I don't know how to {name}!\n")
                     continue
                 
-                # Chat
-                response = gena.chat(user_input)
-                print(f"\nGena: {response}\n")
+                # Chat (print tokens as they arrive)
+                if not engine.ready:
+                    print("\n(Waiting for the engine to start...)", end="", flush=True)
+                print("\nGena: ", end="", flush=True)
+                reply = gena.chat(user_input, stream=True)
+                try:
+                    for chunk in reply:
+                        print(chunk, end="", flush=True)
+                except KeyboardInterrupt:
+                    # Ctrl+C stops this answer only; closing the stream
+                    # drops the connection so the backend stops decoding
+                    reply.close()
+                    print(" [stopped]", end="")
+                print("\n")
             
             except KeyboardInterrupt:
                 print("\n\nGena: Goodbye! 👋\n")
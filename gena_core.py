@@ -5,25 +5,44 @@ Clean architecture with swappable backends
 """
 
 import json
-from datetime import datetime
-from pathlib import Path
-import requests
 import sys
 
+from connectivity import ConnectivityMonitor
+from storage import JsonMemory
+from tool_parser import parse_tool_calls
+
 
 class GenaAI:
     """Core Gena AI - personality, memory, tools"""
     
-    def __init__(self, engine, memory_file="gena_memory.json"):
+    # Conversation lines kept in memory
+    HISTORY_LINES = 20
+    
+    def __init__(self, engine, memory_file="gena_memory.json", journal=True, compact_every=500,
+                 storage=None, connectivity=None):
         """
         Args:
             engine: Backend engine (OllamaEngine or LlamaCppEngine)
             memory_file: Path to JSON memory file
+            journal: Append each change to a journal next to memory_file
+                     instead of rewriting the whole file every time
+            compact_every: Journal records after which memory_file is
+                           rewritten and the journal cleared
+            storage: Optional MemoryBackend to use instead of memory_file
+                     (e.g. a SQLite Memory shared with Gena, which keeps
+                     its history and compacts it itself)
+            connectivity: ConnectivityMonitor answering `online` (default:
+                          probes ConnectivityMonitor.DEFAULT_TARGET in the
+                          background)
         """
         self.engine = engine
-        self.memory_file = Path(memory_file)
-        self.memory = self.load_memory()
-        self.online = self.check_online()
+        if storage is None:
+            storage = JsonMemory(memory_file, journal, compact_every)
+        self.storage = storage
+        # Backends that archive and summarize old history (Memory) own
+        # retention; trimming here would delete it before it's compacted
+        self.trim_history = not hasattr(storage, 'compact_conversations')
+        self.connectivity = connectivity if connectivity is not None else ConnectivityMonitor()
         
         # Compact system prompt
         self.system_prompt = """You are Gena, a cute AI assistant!
@@ -40,63 +59,45 @@ TOOLS AVAILABLE:
 To use a tool, respond with: TOOL[tool_name](args)
 Example: TOOL[execute_python](2 + 2)"""
 
-    def load_memory(self):
-        """Load persistent memory"""
-        if self.memory_file.exists():
-            try:
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return self.default_memory()
-        return self.default_memory()
-    
-    def default_memory(self):
-        """Initialize memory structure"""
-        return {
-            "user_info": {},
-            "preferences": {},
-            "learned_facts": {},
-            "learned_procedures": {},
-            "conversation_history": [],
-            "interaction_count": 0,
-            "first_interaction": datetime.now().isoformat(),
-        }
+    def close(self):
+        """Flush and close memory storage"""
+        self.connectivity.stop()
+        self.storage.close()
     
-    def save_memory(self):
-        """Save memory to JSON"""
-        with open(self.memory_file, 'w', encoding='utf-8') as f:
-            json.dump(self.memory, f, indent=2, ensure_ascii=False)
+    @property
+    def online(self):
+        """Whether the network is reachable (last background probe; never blocks)"""
+        return self.connectivity.online
     
     def check_online(self):
-        """Check internet connection"""
-        try:
-            requests.get("https://www.google.com", timeout=2)
-            return True
-        except:
-            return False
+        """Check internet connection now"""
+        return self.connectivity.check()
     
     def get_context(self):
         """Get compact context for LLM"""
         context = f"\n[MEMORY]\n"
-        context += f"Chats: {self.memory['interaction_count']} | "
+        context += f"Chats: {self.storage.get_interaction_count()} | "
         context += f"Online: {'Yes' if self.online else 'No'}\n"
         
-        if self.memory['user_info']:
-            context += f"User: {json.dumps(self.memory['user_info'])}\n"
+        user_info = self.storage.get_user_info()
+        if user_info:
+            context += f"User: {json.dumps(user_info)}\n"
         
         # Show learned facts
-        if self.memory['learned_facts']:
-            context += f"Facts I know: {len(self.memory['learned_facts'])} topics\n"
+        facts_count = self.storage.get_facts_count()
+        if facts_count:
+            context += f"Facts I know: {facts_count} topics\n"
         
         # Show learned procedures
-        if self.memory['learned_procedures']:
-            context += f"Procedures I learned: {', '.join(self.memory['learned_procedures'].keys())}\n"
+        procedures = self.storage.get_procedures_list()
+        if procedures:
+            context += f"Procedures I learned: {', '.join(procedures)}\n"
         
         # Last 2 exchanges only
-        if self.memory['conversation_history']:
+        recent = self.storage.get_recent_lines(limit=4)
+        if recent:
             context += "Recent:\n"
-            for entry in self.memory['conversation_history'][-4:]:
-                context += f"{entry}\n"
+            context += "".join(recent)
         
         return context
     
@@ -140,61 +141,37 @@ Example: TOOL[execute_python](2 + 2)"""
     
     def learn_fact(self, topic, fact):
         """Learn and remember a fact"""
-        self.memory['learned_facts'][topic] = {
-            "content": fact,
-            "learned_at": datetime.now().isoformat()
-        }
-        self.save_memory()
-        return f"Got it! I'll remember that about {topic}."
+        return self.storage.learn_fact(topic, fact)
     
     def learn_procedure(self, name, steps):
         """Learn a procedure"""
-        self.memory['learned_procedures'][name] = {
-            "steps": steps,
-            "learned_at": datetime.now().isoformat()
-        }
-        self.save_memory()
-        return f"Yay! I learned how to {name}!"
+        return self.storage.learn_procedure(name, steps)
     
     def process_tools(self, response):
         """Check if response contains tool calls and execute them"""
-        if "TOOL[" not in response:
-            return response
-        
-        # Extract tool calls
-        import re
-        pattern = r'TOOL\[(\w+)\]\(([^)]+)\)'
-        matches = re.findall(pattern, response)
-        
-        if not matches:
+        clean_response, calls = parse_tool_calls(response)
+        if not calls:
             return response
         
         # Execute tools
         results = []
-        for tool_name, args in matches:
-            if tool_name == "execute_python":
-                result = self.execute_python(args)
+        for call in calls:
+            if call.name == "execute_python":
+                result = self.execute_python(call.raw_args)
                 results.append(result)
-            elif tool_name == "learn_fact":
+            elif call.name == "learn_fact":
                 # Parse topic, fact
-                parts = args.split(',', 1)
-                if len(parts) == 2:
-                    topic = parts[0].strip().strip('"').strip("'")
-                    fact = parts[1].strip().strip('"').strip("'")
-                    result = self.learn_fact(topic, fact)
+                args = call.arguments(['topic', 'fact'])
+                if args:
+                    result = self.learn_fact(str(args[0]), str(args[1]))
                     results.append(result)
-            elif tool_name == "learn_procedure":
+            elif call.name == "learn_procedure":
                 # Parse name, steps
-                parts = args.split(',', 1)
-                if len(parts) == 2:
-                    name = parts[0].strip().strip('"').strip("'")
-                    steps = parts[1].strip().strip('"').strip("'")
-                    result = self.learn_procedure(name, steps)
+                args = call.arguments(['name', 'steps'])
+                if args:
+                    result = self.learn_procedure(str(args[0]), args[1])
                     results.append(result)
         
-        # Remove tool calls from response
-        clean_response = re.sub(pattern, '', response)
-        
         # Append results
         if results:
             clean_response += "\n" + "\n".join(results)
@@ -211,11 +188,10 @@ Example: TOOL[execute_python](2 + 2)"""
     
     def chat(self, user_message):
         """Main chat interface"""
-        self.memory['interaction_count'] += 1
-        
         # Save user message
-        timestamp = datetime.now().strftime("%H:%M")
-        self.memory['conversation_history'].append(f"[{timestamp}] U: {user_message}")
+        with self.storage.transaction():
+            self.storage.increment_interaction_count()
+            self.storage.add_message('user', user_message)
         
         # Generate response
         response = self.generate(user_message)
@@ -223,12 +199,9 @@ Example: TOOL[execute_python](2 + 2)"""
         # Process any tool calls
         response = self.process_tools(response)
         
-        # Save response
-        self.memory['conversation_history'].append(f"[{timestamp}] G: {response}")
-        
-        # Keep only last 10 exchanges
-        if len(self.memory['conversation_history']) > 20:
-            self.memory['conversation_history'] = self.memory['conversation_history'][-20:]
-        
-        self.save_memory()
+        # Save response, keeping only the last 10 exchanges
+        with self.storage.transaction():
+            self.storage.add_message('assistant', response)
+            if self.trim_history:
+                self.storage.clear_old_conversations(keep_last=self.HISTORY_LINES)
         return response
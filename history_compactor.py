@@ -0,0 +1,105 @@
+"""
+History Compactor for Gena AI
+Summarizes old conversation history in the background
+"""
+
+import threading
+
+
+class HistoryCompactor:
+    """
+    Tiered conversation history
+    
+    Recent messages stay raw in the conversations table. Every interval
+    seconds, sessions with a full batch of messages beyond the last
+    keep_last get that oldest batch summarized (by summarize_fn) and
+    moved to the archive table, so chat turns never pay for cleanup and
+    nothing is thrown away. With an idle_fn, batches are only summarized
+    while it returns True; the rest waits for the next run.
+    """
+    
+    def __init__(self, memory, summarize_fn, interval=300, keep_last=20, batch_size=12, idle_fn=None):
+        """
+        Args:
+            memory: Memory instance
+            summarize_fn: Callable taking a list of (id, timestamp, role,
+                          message) rows and returning a summary string
+            interval: Seconds between compaction runs
+            keep_last: Messages per session always kept raw
+            batch_size: Messages summarized together
+            idle_fn: Callable returning whether summarize_fn's engine is
+                     free (None = always)
+        """
+        self.memory = memory
+        self.summarize_fn = summarize_fn
+        self.interval = interval
+        self.keep_last = keep_last
+        self.batch_size = batch_size
+        self.idle_fn = idle_fn
+        
+        self.compactions = 0
+        self.deferred = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start compacting in a background thread"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="gena-compactor", daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        """Compaction loop"""
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                # e.g. database locked; try again next run
+                self.errors += 1
+    
+    def run_once(self):
+        """
+        Compact every session that has a full batch
+        
+        Returns:
+            Number of messages archived
+        """
+        archived = 0
+        for session_id in self.memory.get_sessions_to_compact(self.keep_last, self.batch_size):
+            while not self._stop.is_set():
+                if self.idle_fn is not None and not self.idle_fn():
+                    # Engine busy with chats: continue next run
+                    self.deferred += 1
+                    return archived
+                
+                messages = self.memory.get_compactable_messages(self.keep_last, self.batch_size, session_id)
+                if len(messages) < self.batch_size:
+                    break
+                
+                try:
+                    summary = self.summarize_fn(messages)
+                except Exception:
+                    # Engine busy or down: leave it for the next run
+                    self.errors += 1
+                    break
+                if not summary:
+                    break
+                
+                archived += self.memory.compact_conversations(
+                    messages[0][0], messages[-1][0], summary, session_id
+                )
+                self.compactions += 1
+        return archived
+    
+    def get_stats(self):
+        """Get compaction counters"""
+        return {'compactions': self.compactions, 'deferred': self.deferred, 'errors': self.errors}
+    
+    def stop(self, timeout=5):
+        """Stop the background thread (waits up to timeout seconds)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,274 @@
+"""
+llama-server Supervisor for Gena AI
+Runs several llama-server processes and keeps them alive
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from engine_http import create_session
+from engine_llamacpp import LlamaCppEngine, wait_for_server
+from engine_pool import EnginePool
+
+
+class LlamaServerSupervisor:
+    """
+    Manages N llama-server worker processes
+    
+    Each worker gets its own port, thread count and (on Linux) CPU set,
+    e.g. one worker per NUMA node. A worker decodes up to `parallel`
+    requests at once from separate slots with continuous batching. A
+    worker that exits is restarted with exponential backoff.
+    
+    Usage:
+        servers = LlamaServerSupervisor("models/chat/model.gguf", workers=2,
+                                        cpu_sets=[range(0, 8), range(8, 16)])
+        servers.start()
+        gena = Gena(engine=servers.create_pool(), supervisor=servers)
+    """
+    
+    def __init__(self,
+                 model_path,
+                 workers=1,
+                 base_port=8080,
+                 host="http://localhost",
+                 threads=None,
+                 cpu_sets=None,
+                 parallel=4,
+                 context_size=2048,
+                 cont_batching=True,
+                 extra_args=(),
+                 server_bin="llama-server",
+                 ready_timeout=60,
+                 check_interval=1.0,
+                 backoff=1.0,
+                 max_backoff=60):
+        """
+        Args:
+            model_path: Path to GGUF model file
+            workers: Number of llama-server processes
+            base_port: Port of the first worker (next ones count up)
+            host: Host the workers are reached at
+            threads: CPU threads per worker (default: size of its CPU set,
+                     or 4)
+            cpu_sets: Optional list with one iterable of CPU ids per worker
+            parallel: Slots per worker (-np), i.e. requests decoded at once
+            context_size: Context window per slot
+            cont_batching: Enable continuous batching
+            extra_args: More llama-server arguments (e.g. ["--numa", "distribute"])
+            server_bin: llama-server executable
+            ready_timeout: Max seconds to wait for workers on start()
+            check_interval: Seconds between liveness checks
+            backoff: First restart delay (doubles per consecutive crash)
+            max_backoff: Longest restart delay
+        """
+        if cpu_sets is not None and len(cpu_sets) != workers:
+            raise ValueError("cpu_sets needs one entry per worker")
+        
+        self.model_path = Path(model_path)
+        self.host = host
+        self.parallel = parallel
+        self.context_size = context_size
+        self.cont_batching = cont_batching
+        self.extra_args = list(extra_args)
+        self.server_bin = server_bin
+        self.ready_timeout = ready_timeout
+        self.check_interval = check_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        
+        self.workers = []
+        for i in range(workers):
+            cpus = set(cpu_sets[i]) if cpu_sets is not None else None
+            self.workers.append({
+                'port': base_port + i,
+                'cpus': cpus,
+                'threads': threads or (len(cpus) if cpus else 4),
+                'process': None,
+                'started_at': None,
+                'restart_at': None,
+                'failures': 0,
+                'restarts': 0
+            })
+        
+        self.session = create_session(pool_size=workers, max_retries=0)
+        self._stop = threading.Event()
+        self._monitor_thread = None
+    
+    # ==================== PROCESSES ====================
+    
+    def _command(self, worker):
+        """llama-server command line of a worker"""
+        cmd = [
+            self.server_bin,
+            "-m", str(self.model_path),
+            # The context is split between the slots
+            "-c", str(self.context_size * self.parallel),
+            "-np", str(self.parallel),
+            "--port", str(worker['port']),
+            "-t", str(worker['threads']),
+            "--log-disable"
+        ]
+        if self.cont_batching:
+            cmd.append("--cont-batching")
+        return cmd + self.extra_args
+    
+    def _spawn(self, worker):
+        """Start a worker's process"""
+        cmd = self._command(worker)
+        cpus = worker['cpus']
+        taskset = shutil.which("taskset") if cpus else None
+        if taskset:
+            # Pinned from exec on, so every server thread inherits it
+            # (no preexec_fn: unsafe with our other threads running)
+            cmd = [taskset, "-c", ",".join(str(cpu) for cpu in sorted(cpus))] + cmd
+        
+        worker['process'] = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        worker['started_at'] = time.monotonic()
+        
+        if cpus and not taskset and hasattr(os, 'sched_setaffinity'):
+            # Right after the start, before the server loads the model
+            # and creates its worker threads
+            try:
+                os.sched_setaffinity(worker['process'].pid, cpus)
+            except OSError:
+                pass  # Already exited; the monitor restarts it
+    
+    def _check(self, worker):
+        """True once a worker answers /health with 200 (model loaded)"""
+        try:
+            response = self.session.get(f"{self.host}:{worker['port']}/health", timeout=1)
+            return response.status_code == 200
+        except Exception:
+            return False
+    
+    def start(self):
+        """
+        Launch all workers and wait until they are ready
+        
+        Returns:
+            True if every worker became ready
+        """
+        if not self.model_path.exists():
+            print(f"✗ Model file not found: {self.model_path}")
+            return False
+        
+        print(f"Starting {len(self.workers)} llama.cpp server(s)...")
+        try:
+            # All launched first so they load the model in parallel
+            for worker in self.workers:
+                self._spawn(worker)
+        except FileNotFoundError:
+            print("✗ llama-server not found! Install llama.cpp first.")
+            self.stop()
+            return False
+        except (OSError, subprocess.SubprocessError) as e:
+            # e.g. a CPU set naming CPUs this machine doesn't have
+            print(f"✗ Error: {e}")
+            self.stop()
+            return False
+        
+        ready = True
+        for worker in self.workers:
+            if not wait_for_server(lambda: self._check(worker), worker['process'], self.ready_timeout):
+                print(f"✗ Server on port {worker['port']} failed to start")
+                ready = False
+        
+        self._stop.clear()
+        self._monitor_thread = threading.Thread(target=self._monitor, name="gena-llama-supervisor", daemon=True)
+        self._monitor_thread.start()
+        
+        if ready:
+            print(f"✓ llama.cpp server(s) ready on port(s) {', '.join(str(w['port']) for w in self.workers)}")
+        return ready
+    
+    def _monitor(self):
+        """Restart workers whose process has exited"""
+        while not self._stop.wait(self.check_interval):
+            now = time.monotonic()
+            for worker in self.workers:
+                process = worker['process']
+                if process is not None and process.poll() is None:
+                    # Stable for a while: forget earlier crashes
+                    if worker['failures'] and now - worker['started_at'] > self.max_backoff:
+                        worker['failures'] = 0
+                    continue
+                
+                if worker['restart_at'] is None:
+                    delay = min(self.backoff * 2 ** worker['failures'], self.max_backoff)
+                    worker['failures'] += 1
+                    worker['restart_at'] = now + delay
+                    code = process.returncode if process is not None else None
+                    print(f"✗ llama.cpp server on port {worker['port']} exited ({code}), "
+                          f"restarting in {delay:.1f}s")
+                elif now >= worker['restart_at']:
+                    worker['restart_at'] = None
+                    worker['restarts'] += 1
+                    try:
+                        self._spawn(worker)
+                    except OSError:
+                        worker['process'] = None
+    
+    def stop(self, timeout=10):
+        """Stop all workers (SIGTERM, then SIGKILL after timeout seconds)"""
+        self._stop.set()
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
+            self._monitor_thread = None
+        
+        processes = [w['process'] for w in self.workers if w['process'] is not None]
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        for worker in self.workers:
+            worker['process'] = None
+        
+        if processes:
+            print("✓ llama.cpp server(s) stopped")
+        self.session.close()
+    
+    # ==================== ENGINES ====================
+    
+    def create_engines(self, **engine_kwargs):
+        """One LlamaCppEngine per worker (extra arguments go to each engine)"""
+        return [
+            LlamaCppEngine(
+                port=worker['port'],
+                host=self.host,
+                context_size=self.context_size,
+                num_threads=worker['threads'],
+                auto_start=False,
+                **engine_kwargs
+            )
+            for worker in self.workers
+        ]
+    
+    def create_pool(self, health_interval=10, **engine_kwargs):
+        """EnginePool over all workers"""
+        return EnginePool(self.create_engines(**engine_kwargs), health_interval=health_interval)
+    
+    def get_stats(self):
+        """Per-worker process status"""
+        return [
+            {
+                'port': worker['port'],
+                'pid': worker['process'].pid if worker['process'] else None,
+                'running': worker['process'] is not None and worker['process'].poll() is None,
+                'restarts': worker['restarts']
+            }
+            for worker in self.workers
+        ]
@@ -5,23 +5,131 @@ Manages all persistent data using SQLite
 
 import sqlite3
 import json
+import re
+import threading
+from bisect import insort
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from pathlib import Path
 
 
+# Session used when callers don't pass one (single-user setups)
+DEFAULT_SESSION = "default"
+
+# Words too common to be worth searching facts for
+SEARCH_STOPWORDS = frozenset("""
+    a an and are as at be but by can do for from had has have how i if in is
+    it me my no not of on or so that the their them then there these they
+    this to was we were what when where which who why will with you your
+""".split())
+
+# SQLite tuning profiles, applied as PRAGMAs on every connection
+STORAGE_PROFILES = {
+    # Plain SQLite defaults (rollback journal, fsync on every commit)
+    'default': {
+        'busy_timeout': 5000,
+    },
+    # Readers never wait for the writer; commits skip most fsyncs
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16000,  # Negative = KiB, so ~16 MB
+        'busy_timeout': 5000,
+        'temp_store': 'MEMORY',
+    },
+}
+
+
 class Memory:
     """SQLite-based memory management"""
     
-    def __init__(self, db_path="memory.db"):
-        """Initialize memory database"""
+    # Recent messages shown in the context summary
+    CONTEXT_RECENT = 4
+    
+    # Recent messages kept in the context snapshot (what a prompt builder
+    # can pack into the prompt without running SQL)
+    CONTEXT_HISTORY = 20
+    
+    # Latest history summaries kept in the context snapshot
+    CONTEXT_SUMMARIES = 3
+    
+    # Sessions whose context snapshot is kept in RAM (least recently used
+    # ones are dropped first)
+    CONTEXT_CACHE_SESSIONS = 1024
+    
+    def __init__(self, db_path="memory.db", profile="wal"):
+        """
+        Initialize memory database
+        
+        Args:
+            db_path: Path to SQLite file (or ":memory:")
+            profile: Name in STORAGE_PROFILES or a dict of PRAGMA values
+        """
         self.db_path = Path(db_path)
-        self.conn = None
+        self.pragmas = STORAGE_PROFILES[profile] if isinstance(profile, str) else dict(profile)
+        
+        # Each thread gets its own connection (see conn)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        
+        self._closed = False
+        
+        # An in-memory database only exists inside one connection, which
+        # all threads share; transactions on it take turns (see transaction)
+        self._shared_conn = None
+        self._shared_lock = threading.RLock()
+        if str(db_path) == ":memory:":
+            self._shared_conn = self._connect()
+        
+        # Context snapshots per session, kept current by the write methods
+        # (see get_context_summary)
+        self._context_cache = OrderedDict()
+        self._procedures_cache = None
+        self._cache_lock = threading.RLock()
+        
+        # Bumped by every write to a session (and again when it commits),
+        # so a snapshot read from SQL while a write ran isn't cached
+        self._context_generations = {}
+        self._context_epoch = 0
+        self.context_cache_hits = 0
+        self.context_cache_misses = 0
+        
+        # Optional callback(session_id, topic, content) run after learn_fact
+        self.on_fact_learned = None
+        
         self.init_database()
     
+    @property
+    def conn(self):
+        """SQLite connection for the calling thread"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Memory is closed")
+        if self._shared_conn is not None:
+            return self._shared_conn
+        
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+    
+    def _connect(self):
+        """Open a new connection with the storage profile applied"""
+        # Only the owning thread uses it, but close() may run elsewhere
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # Access columns by name
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
     def init_database(self):
         """Create database tables if they don't exist"""
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row  # Access columns by name
         cursor = self.conn.cursor()
         
         # Settings table (persona, preferences, configs)
@@ -33,21 +141,25 @@ class Memory:
             )
         ''')
         
-        # User info table
+        # User info table (per session)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS user_info (
-                key TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL DEFAULT 'default',
+                key TEXT,
                 value TEXT,
-                updated_at TEXT
+                updated_at TEXT,
+                PRIMARY KEY (session_id, key)
             )
         ''')
         
-        # Learned facts table
+        # Learned facts table (per session)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS facts (
-                topic TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL DEFAULT 'default',
+                topic TEXT,
                 content TEXT,
-                learned_at TEXT
+                learned_at TEXT,
+                PRIMARY KEY (session_id, topic)
             )
         ''')
         
@@ -66,7 +178,42 @@ class Memory:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 timestamp TEXT,
                 role TEXT,
-                message TEXT
+                message TEXT,
+                session_id TEXT NOT NULL DEFAULT 'default'
+            )
+        ''')
+        
+        # Summaries of compacted history (each covers a range of
+        # conversation ids, now in conversation_archive)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS conversation_summaries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                first_id INTEGER,
+                last_id INTEGER,
+                summary TEXT,
+                created_at TEXT
+            )
+        ''')
+        
+        # Compacted history, kept verbatim but out of the hot table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS conversation_archive (
+                id INTEGER PRIMARY KEY,
+                timestamp TEXT,
+                role TEXT,
+                message TEXT,
+                session_id TEXT NOT NULL
+            )
+        ''')
+        
+        # Sessions table (one row per conversation partner)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                interaction_count INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT,
+                last_active TEXT
             )
         ''')
         
@@ -78,19 +225,184 @@ class Memory:
             )
         ''')
         
+        # Databases from before sessions existed
+        self._migrate_sessions(cursor)
+        
+        # Per-session history lookups and cleanup
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_conversations_session
+            ON conversations (session_id, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_summaries_session
+            ON conversation_summaries (session_id, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_archive_session
+            ON conversation_archive (session_id, id)
+        ''')
+        
+        # Full-text search over facts and procedures
+        self.fts_enabled = self._init_search_index(cursor)
+        
         self.conn.commit()
         
         # Initialize defaults
         self._init_defaults()
     
+    def _migrate_sessions(self, cursor):
+        """Add session_id to tables created by older versions"""
+        def columns(table):
+            cursor.execute(f'PRAGMA table_info({table})')
+            return [row['name'] for row in cursor.fetchall()]
+        
+        if 'session_id' not in columns('conversations'):
+            cursor.execute('''
+                ALTER TABLE conversations
+                ADD COLUMN session_id TEXT NOT NULL DEFAULT 'default'
+            ''')
+        
+        # Primary keys can't be altered in place, so rebuild these tables
+        for table, key in [('user_info', 'key'), ('facts', 'topic')]:
+            cols = columns(table)
+            if 'session_id' in cols:
+                continue
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+            cursor.execute(f'''
+                CREATE TABLE {table} (
+                    session_id TEXT NOT NULL DEFAULT 'default',
+                    {key} TEXT,
+                    {cols[1]} TEXT,
+                    {cols[2]} TEXT,
+                    PRIMARY KEY (session_id, {key})
+                )
+            ''')
+            cursor.execute(f'''
+                INSERT INTO {table} ({', '.join(cols)})
+                SELECT {', '.join(cols)} FROM {table}_old
+            ''')
+            cursor.execute(f'DROP TABLE {table}_old')
+        
+        # Interaction count used to be a global metadata value
+        cursor.execute("SELECT value FROM metadata WHERE key = 'interaction_count'")
+        row = cursor.fetchone()
+        if row:
+            cursor.execute('''
+                INSERT OR IGNORE INTO sessions (session_id, interaction_count, created_at)
+                VALUES (?, ?, ?)
+            ''', (DEFAULT_SESSION, int(row['value'] or 0), datetime.now().isoformat()))
+            cursor.execute("DELETE FROM metadata WHERE key = 'interaction_count'")
+    
+    def _init_search_index(self, cursor):
+        """
+        Create FTS5 indexes over facts and procedures
+        
+        The indexes mirror their tables (external content) and are kept in
+        sync by triggers, so every write path updates them. Returns False
+        if this SQLite build has no FTS5.
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('facts_fts', 'procedures_fts')")
+        existing = {row['name'] for row in cursor.fetchall()}
+        
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5(
+                    session_id, topic, content,
+                    content='facts', content_rowid='rowid',
+                    tokenize='porter unicode61'
+                )
+            ''')
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS procedures_fts USING fts5(
+                    name, steps,
+                    content='procedures', content_rowid='rowid',
+                    tokenize='porter unicode61'
+                )
+            ''')
+        except sqlite3.OperationalError:
+            return False
+        
+        for table, columns in [('facts', ['session_id', 'topic', 'content']),
+                               ('procedures', ['name', 'steps'])]:
+            cols = ', '.join(columns)
+            new_values = ', '.join(f'new.{c}' for c in columns)
+            old_values = ', '.join(f'old.{c}' for c in columns)
+            cursor.executescript(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {table}_fts (rowid, {cols}) VALUES (new.rowid, {new_values});
+                END;
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {table}_fts ({table}_fts, rowid, {cols})
+                    VALUES ('delete', old.rowid, {old_values});
+                END;
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN
+                    INSERT INTO {table}_fts ({table}_fts, rowid, {cols})
+                    VALUES ('delete', old.rowid, {old_values});
+                    INSERT INTO {table}_fts (rowid, {cols}) VALUES (new.rowid, {new_values});
+                END;
+            ''')
+            
+            # Index rows written before the index existed
+            if f'{table}_fts' not in existing:
+                cursor.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+        
+        return True
+    
+    def rebuild_search_index(self):
+        """Re-index all facts and procedures (e.g. after a VACUUM)"""
+        if self.fts_enabled:
+            with self.transaction():
+                self.conn.execute("INSERT INTO facts_fts (facts_fts) VALUES ('rebuild')")
+                self.conn.execute("INSERT INTO procedures_fts (procedures_fts) VALUES ('rebuild')")
+    
     def _init_defaults(self):
         """Set default values if not present"""
-        if not self.get_metadata('interaction_count'):
-            self.set_metadata('interaction_count', '0')
-        
         if not self.get_metadata('first_interaction'):
             self.set_metadata('first_interaction', datetime.now().isoformat())
     
+    # ==================== TRANSACTIONS ====================
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Group several writes into one transaction (a single commit)
+        
+        Writes inside the block don't commit on their own; everything is
+        committed together on exit, or rolled back if the block raises.
+        Blocks can be nested; only the outermost one commits. Every write
+        method runs in one, so single writes commit on their own.
+        
+        With ":memory:" all threads share one connection, so a block
+        holds a lock until it ends: another thread's commit or rollback
+        can't end this thread's transaction halfway.
+        
+        Usage:
+            with memory.transaction():
+                memory.add_message('user', text)
+                memory.add_message('assistant', reply)
+        """
+        lock = self._shared_lock if self._shared_conn is not None else nullcontext()
+        with lock:
+            # Depth is per thread, like the connection it applies to
+            local = self._local
+            local.tx_depth = getattr(local, 'tx_depth', 0) + 1
+            if local.tx_depth == 1:
+                local.tx_sessions = {}
+            try:
+                yield self
+            except BaseException:
+                local.tx_depth -= 1
+                if local.tx_depth == 0:
+                    self.conn.rollback()
+                    # Snapshots may hold writes that were just rolled back
+                    self.invalidate_context_cache()
+                raise
+            else:
+                local.tx_depth -= 1
+                if local.tx_depth == 0:
+                    self.conn.commit()
+                    self._committed_context(local.tx_sessions)
+    
     # ==================== METADATA ====================
     
     def get_metadata(self, key):
@@ -102,41 +414,82 @@ class Memory:
     
     def set_metadata(self, key, value):
         """Set metadata value"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO metadata (key, value) 
-            VALUES (?, ?)
-        ''', (key, str(value)))
-        self.conn.commit()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO metadata (key, value) 
+                VALUES (?, ?)
+            ''', (key, str(value)))
+    
+    # ==================== SESSIONS ====================
     
-    def increment_interaction_count(self):
+    def increment_interaction_count(self, session_id=DEFAULT_SESSION):
         """Increment and return interaction count"""
-        count = int(self.get_metadata('interaction_count') or 0)
-        count += 1
-        self.set_metadata('interaction_count', count)
+        now = datetime.now().isoformat()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO sessions (session_id, interaction_count, created_at, last_active)
+                VALUES (?, 1, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    interaction_count = interaction_count + 1,
+                    last_active = excluded.last_active
+            ''', (session_id, now, now))
+        
+        count = self.get_interaction_count(session_id)
+        with self._cache_lock:
+            self._touch_context(session_id)
+            snapshot = self._context_cache.get(session_id)
+            if snapshot:
+                snapshot['count'] = count
         return count
     
+    def get_interaction_count(self, session_id=DEFAULT_SESSION):
+        """Get number of chats in a session"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT interaction_count FROM sessions WHERE session_id = ?', (session_id,))
+        row = cursor.fetchone()
+        return row['interaction_count'] if row else 0
+    
+    def get_sessions(self):
+        """Get list of session ids"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT session_id FROM sessions ORDER BY last_active DESC')
+        return [row['session_id'] for row in cursor.fetchall()]
+    
     # ==================== USER INFO ====================
     
-    def get_user_info(self, key=None):
+    def get_user_info(self, key=None, session_id=DEFAULT_SESSION):
         """Get user info (all or specific key)"""
         cursor = self.conn.cursor()
         if key:
-            cursor.execute('SELECT value FROM user_info WHERE key = ?', (key,))
+            cursor.execute(
+                'SELECT value FROM user_info WHERE session_id = ? AND key = ?',
+                (session_id, key)
+            )
             row = cursor.fetchone()
             return row['value'] if row else None
         else:
-            cursor.execute('SELECT key, value FROM user_info')
+            cursor.execute(
+                'SELECT key, value FROM user_info WHERE session_id = ? ORDER BY key',
+                (session_id,)
+            )
             return {row['key']: row['value'] for row in cursor.fetchall()}
     
-    def set_user_info(self, key, value):
+    def set_user_info(self, key, value, session_id=DEFAULT_SESSION):
         """Set user info"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_info (key, value, updated_at) 
-            VALUES (?, ?, ?)
-        ''', (key, value, datetime.now().isoformat()))
-        self.conn.commit()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO user_info (session_id, key, value, updated_at) 
+                VALUES (?, ?, ?, ?)
+            ''', (session_id, key, value, datetime.now().isoformat()))
+        
+        with self._cache_lock:
+            self._touch_context(session_id)
+            snapshot = self._context_cache.get(session_id)
+            if snapshot:
+                snapshot['user_info'][key] = value
     
     # ==================== SETTINGS ====================
     
@@ -149,44 +502,108 @@ class Memory:
     
     def set_setting(self, key, value):
         """Set a setting"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO settings (key, value, updated_at) 
-            VALUES (?, ?, ?)
-        ''', (key, value, datetime.now().isoformat()))
-        self.conn.commit()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO settings (key, value, updated_at) 
+                VALUES (?, ?, ?)
+            ''', (key, value, datetime.now().isoformat()))
     
     # ==================== FACTS ====================
     
-    def get_fact(self, topic):
+    def get_fact(self, topic, session_id=DEFAULT_SESSION):
         """Get a learned fact"""
         cursor = self.conn.cursor()
-        cursor.execute('SELECT content FROM facts WHERE topic = ?', (topic,))
+        cursor.execute(
+            'SELECT content FROM facts WHERE session_id = ? AND topic = ?',
+            (session_id, topic)
+        )
         row = cursor.fetchone()
         return row['content'] if row else None
     
-    def get_all_facts(self):
+    def get_all_facts(self, session_id=DEFAULT_SESSION):
         """Get all learned facts"""
         cursor = self.conn.cursor()
-        cursor.execute('SELECT topic, content FROM facts')
+        cursor.execute('SELECT topic, content FROM facts WHERE session_id = ?', (session_id,))
         return {row['topic']: row['content'] for row in cursor.fetchall()}
     
-    def learn_fact(self, topic, content):
+    def learn_fact(self, topic, content, session_id=DEFAULT_SESSION):
         """Learn a new fact"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO facts (topic, content, learned_at) 
-            VALUES (?, ?, ?)
-        ''', (topic, content, datetime.now().isoformat()))
-        self.conn.commit()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            
+            # Only a new topic changes the cached fact count
+            with self._cache_lock:
+                snapshot = self._context_cache.get(session_id)
+            if snapshot:
+                cursor.execute(
+                    'SELECT 1 FROM facts WHERE session_id = ? AND topic = ?',
+                    (session_id, topic)
+                )
+                is_new = cursor.fetchone() is None
+            
+            # Upsert (not REPLACE) so the search index triggers see the update
+            cursor.execute('''
+                INSERT INTO facts (session_id, topic, content, learned_at) 
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(session_id, topic) DO UPDATE SET
+                    content = excluded.content,
+                    learned_at = excluded.learned_at
+            ''', (session_id, topic, content, datetime.now().isoformat()))
+        
+        with self._cache_lock:
+            self._touch_context(session_id)
+            if snapshot and is_new:
+                snapshot['facts_count'] += 1
+        
+        if self.on_fact_learned:
+            self.on_fact_learned(session_id, topic, content)
         return f"Got it! I'll remember that about {topic}."
     
-    def get_facts_count(self):
+    def get_facts_count(self, session_id=DEFAULT_SESSION):
         """Get count of learned facts"""
         cursor = self.conn.cursor()
-        cursor.execute('SELECT COUNT(*) as count FROM facts')
+        cursor.execute('SELECT COUNT(*) as count FROM facts WHERE session_id = ?', (session_id,))
         return cursor.fetchone()['count']
     
+    def search_facts(self, query, limit=3, session_id=DEFAULT_SESSION):
+        """
+        Find the facts most relevant to a piece of text (BM25 ranked)
+        
+        Args:
+            query: Free text, e.g. the user's message
+            limit: Max facts to return
+            session_id: Session whose facts are searched
+        
+        Returns:
+            List of (topic, content) tuples, best match first
+        """
+        terms = self._search_terms(query)
+        if not terms or not self.fts_enabled:
+            return []
+        
+        # The session is filtered in the JOIN: a session_id phrase in the
+        # MATCH makes FTS intersect with every fact of a big session
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT f.topic, f.content
+            FROM facts_fts
+            JOIN facts f ON f.rowid = facts_fts.rowid
+            WHERE facts_fts MATCH ? AND f.session_id = ?
+            ORDER BY bm25(facts_fts, 0.0, 2.0, 1.0)
+            LIMIT ?
+        ''', (terms, session_id, limit))
+        return [(row['topic'], row['content']) for row in cursor.fetchall()]
+    
+    @staticmethod
+    def _search_terms(text, max_terms=12):
+        """Turn free text into an FTS5 OR-query of its distinctive words"""
+        terms = []
+        for word in re.findall(r'\w+', text.lower()):
+            if len(word) > 1 and word not in SEARCH_STOPWORDS and word not in terms:
+                terms.append(word)
+        return ' OR '.join(f'"{word}"' for word in terms[:max_terms])
+    
     # ==================== PROCEDURES ====================
     
     def get_procedure(self, name):
@@ -206,115 +623,398 @@ class Memory:
     
     def learn_procedure(self, name, steps):
         """Learn a new procedure"""
+        with self.transaction():
+            cursor = self.conn.cursor()
+            # Store steps as JSON
+            steps_json = json.dumps(steps if isinstance(steps, list) else [steps])
+            cursor.execute('''
+                INSERT INTO procedures (name, steps, learned_at) 
+                VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    steps = excluded.steps,
+                    learned_at = excluded.learned_at
+            ''', (name, steps_json, datetime.now().isoformat()))
+        
+        with self._cache_lock:
+            if self._procedures_cache is not None and name not in self._procedures_cache:
+                insort(self._procedures_cache, name)
+        return f"Yay! I learned how to {name}!"
+    
+    def search_procedures(self, query, limit=2):
+        """
+        Find the procedures most relevant to a piece of text
+        
+        Returns:
+            List of (name, steps) tuples, best match first
+        """
+        terms = self._search_terms(query)
+        if not terms or not self.fts_enabled:
+            return []
+        
         cursor = self.conn.cursor()
-        # Store steps as JSON
-        steps_json = json.dumps(steps if isinstance(steps, list) else [steps])
         cursor.execute('''
-            INSERT OR REPLACE INTO procedures (name, steps, learned_at) 
-            VALUES (?, ?, ?)
-        ''', (name, steps_json, datetime.now().isoformat()))
-        self.conn.commit()
-        return f"Yay! I learned how to {name}!"
+            SELECT p.name, p.steps
+            FROM procedures_fts
+            JOIN procedures p ON p.rowid = procedures_fts.rowid
+            WHERE procedures_fts MATCH ?
+            ORDER BY bm25(procedures_fts, 2.0, 1.0)
+            LIMIT ?
+        ''', (terms, limit))
+        return [(row['name'], json.loads(row['steps'])) for row in cursor.fetchall()]
     
     def get_procedures_list(self):
         """Get list of procedure names"""
         cursor = self.conn.cursor()
-        cursor.execute('SELECT name FROM procedures')
+        cursor.execute('SELECT name FROM procedures ORDER BY name')
         return [row['name'] for row in cursor.fetchall()]
     
     # ==================== CONVERSATION HISTORY ====================
     
-    def add_message(self, role, message):
+    def add_message(self, role, message, session_id=DEFAULT_SESSION):
         """Add message to conversation history"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO conversations (timestamp, role, message) 
-            VALUES (?, ?, ?)
-        ''', (datetime.now().isoformat(), role, message))
-        self.conn.commit()
+        now = datetime.now()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO conversations (session_id, timestamp, role, message) 
+                VALUES (?, ?, ?, ?)
+            ''', (session_id, now.isoformat(), role, message))
+        
+        with self._cache_lock:
+            self._touch_context(session_id)
+            snapshot = self._context_cache.get(session_id)
+            if snapshot:
+                snapshot['recent'].append(self._format_recent(now, role, message))
     
-    def get_recent_conversations(self, limit=10):
+    def get_recent_conversations(self, limit=10, session_id=DEFAULT_SESSION):
         """Get recent conversation history"""
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT timestamp, role, message 
             FROM conversations 
+            WHERE session_id = ?
             ORDER BY id DESC 
             LIMIT ?
-        ''', (limit,))
+        ''', (session_id, limit))
         rows = cursor.fetchall()
         return [(row['timestamp'], row['role'], row['message']) for row in reversed(rows)]
     
-    def clear_old_conversations(self, keep_last=20):
+    def clear_old_conversations(self, keep_last=20, session_id=DEFAULT_SESSION):
         """Keep only recent conversations"""
+        with self.transaction():
+            cursor = self.conn.cursor()
+            # Both lookups walk the (session_id, id) index from the newest row
+            cursor.execute('''
+                DELETE FROM conversations 
+                WHERE session_id = ? AND id <= (
+                    SELECT id FROM conversations 
+                    WHERE session_id = ?
+                    ORDER BY id DESC 
+                    LIMIT 1 OFFSET ?
+                )
+            ''', (session_id, session_id, keep_last))
+    
+        with self._cache_lock:
+            self._touch_context(session_id)
+            snapshot = self._context_cache.get(session_id)
+            if snapshot:
+                while len(snapshot['recent']) > keep_last:
+                    snapshot['recent'].popleft()
+    
+    # ==================== HISTORY COMPACTION ====================
+    
+    def get_sessions_to_compact(self, keep_last, batch_size):
+        """Sessions with at least batch_size messages beyond the last keep_last"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT session_id FROM conversations
+            GROUP BY session_id
+            HAVING COUNT(*) >= ?
+        ''', (keep_last + batch_size,))
+        return [row['session_id'] for row in cursor.fetchall()]
+    
+    def get_compactable_messages(self, keep_last, limit, session_id=DEFAULT_SESSION):
+        """
+        Oldest messages of a session beyond the last keep_last
+        
+        Returns:
+            List of (id, timestamp, role, message), oldest first
+        """
         cursor = self.conn.cursor()
         cursor.execute('''
-            DELETE FROM conversations 
-            WHERE id NOT IN (
-                SELECT id FROM conversations 
-                ORDER BY id DESC 
-                LIMIT ?
+            SELECT id, timestamp, role, message FROM conversations
+            WHERE session_id = ? AND id <= (
+                SELECT id FROM conversations
+                WHERE session_id = ?
+                ORDER BY id DESC
+                LIMIT 1 OFFSET ?
             )
-        ''', (keep_last,))
-        self.conn.commit()
+            ORDER BY id
+            LIMIT ?
+        ''', (session_id, session_id, keep_last, limit))
+        return [(row['id'], row['timestamp'], row['role'], row['message']) for row in cursor.fetchall()]
+    
+    def compact_conversations(self, first_id, last_id, summary, session_id=DEFAULT_SESSION):
+        """
+        Replace a range of messages by their summary
+        
+        The messages move to conversation_archive in the same transaction
+        as the summary is stored.
+        
+        Returns:
+            Number of messages archived (0 if they were already gone)
+        """
+        now = datetime.now().isoformat()
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT OR IGNORE INTO conversation_archive (id, timestamp, role, message, session_id)
+                SELECT id, timestamp, role, message, session_id FROM conversations
+                WHERE session_id = ? AND id BETWEEN ? AND ?
+            ''', (session_id, first_id, last_id))
+            cursor.execute('''
+                DELETE FROM conversations
+                WHERE session_id = ? AND id BETWEEN ? AND ?
+            ''', (session_id, first_id, last_id))
+            moved = cursor.rowcount
+            if moved:
+                cursor.execute('''
+                    INSERT INTO conversation_summaries (session_id, first_id, last_id, summary, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (session_id, first_id, last_id, summary, now))
+        
+        if moved:
+            with self._cache_lock:
+                self._touch_context(session_id)
+                snapshot = self._context_cache.get(session_id)
+                if snapshot:
+                    snapshot['summaries'].append(summary)
+        return moved
+    
+    def get_summaries(self, limit=None, session_id=DEFAULT_SESSION):
+        """Summaries of compacted history, oldest first (latest limit ones)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT summary FROM conversation_summaries
+            WHERE session_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (session_id, -1 if limit is None else limit))
+        return [row['summary'] for row in reversed(cursor.fetchall())]
+    
+    def get_archived_conversations(self, limit=50, session_id=DEFAULT_SESSION):
+        """Most recent archived (compacted) messages, oldest first"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT timestamp, role, message
+            FROM conversation_archive
+            WHERE session_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (session_id, limit))
+        rows = cursor.fetchall()
+        return [(row['timestamp'], row['role'], row['message']) for row in reversed(rows)]
     
     # ==================== CONTEXT BUILDING ====================
     
-    def get_context_summary(self):
-        """Build compact context for LLM"""
+    def get_context_summary(self, session_id=DEFAULT_SESSION, recent=None):
+        """
+        Build compact context for LLM
+        
+        Served from an in-memory snapshot that the write methods keep up
+        to date, so the usual call runs no SQL. Writes made through
+        another Memory instance (or process) are not seen until
+        invalidate_context_cache() is called.
+        
+        Args:
+            session_id: Conversation session
+            recent: Recent messages to include (default CONTEXT_RECENT,
+                    0 to leave history to the caller)
+        """
+        snapshot = self._get_context_snapshot(session_id)
+        with self._cache_lock:
+            procedures = self._procedures_cache
+        if procedures is None:
+            procedures = self.get_procedures_list()
+            with self._cache_lock:
+                self._procedures_cache = procedures
+        
         context = f"\n[MEMORY]\n"
         
         # Interaction count
-        count = self.get_metadata('interaction_count')
-        context += f"Chats: {count} | "
+        context += f"Chats: {snapshot['count']} | "
         
         # User info
-        user_info = self.get_user_info()
-        if user_info:
-            context += f"User: {json.dumps(user_info)}\n"
+        if snapshot['user_info']:
+            context += f"User: {json.dumps(snapshot['user_info'], sort_keys=True)}\n"
         else:
             context += "\n"
         
         # Facts summary
-        facts_count = self.get_facts_count()
-        if facts_count > 0:
-            context += f"Facts learned: {facts_count}\n"
+        if snapshot['facts_count'] > 0:
+            context += f"Facts learned: {snapshot['facts_count']}\n"
         
         # Procedures summary
-        procedures = self.get_procedures_list()
         if procedures:
             context += f"Procedures: {', '.join(procedures)}\n"
         
         # Recent conversations
-        recent = self.get_recent_conversations(limit=4)
-        if recent:
-            context += "Recent:\n"
-            for timestamp, role, message in recent:
-                time_str = datetime.fromisoformat(timestamp).strftime("%H:%M")
-                role_char = 'U' if role == 'user' else 'G'
-                context += f"[{time_str}] {role_char}: {message}\n"
+        lines = self.get_recent_lines(session_id, self.CONTEXT_RECENT if recent is None else recent)
+        if lines:
+            context += "Recent:\n" + "".join(lines)
         
         return context
     
+    def get_recent_lines(self, session_id=DEFAULT_SESSION, limit=None):
+        """
+        Formatted recent history lines, oldest first
+        
+        Args:
+            session_id: Conversation session
+            limit: Max lines (default and upper bound: CONTEXT_HISTORY)
+        """
+        if limit is not None and limit <= 0:
+            return []
+        snapshot = self._get_context_snapshot(session_id)
+        with self._cache_lock:
+            lines = list(snapshot['recent'])
+        return lines[-limit:] if limit else lines
+    
+    def get_summary_context(self, session_id=DEFAULT_SESSION):
+        """Latest history summaries as a prompt section ("" if none)"""
+        snapshot = self._get_context_snapshot(session_id)
+        with self._cache_lock:
+            summaries = list(snapshot['summaries'])
+        if not summaries:
+            return ""
+        return "Earlier:\n" + "".join(f"- {summary}\n" for summary in summaries)
+    
+    def _get_context_snapshot(self, session_id):
+        """Cached context of a session, read from the database on a miss"""
+        with self._cache_lock:
+            snapshot = self._context_cache.get(session_id)
+            if snapshot:
+                self.context_cache_hits += 1
+                self._context_cache.move_to_end(session_id)
+                return snapshot
+        return self._load_context_snapshot(session_id)
+    
+    def _load_context_snapshot(self, session_id):
+        """
+        Read a session's context from the database into the cache
+        
+        If a write to the session ran meanwhile, the snapshot is returned
+        but not cached: it may miss that write, and the write found no
+        cached snapshot to update.
+        """
+        with self._cache_lock:
+            generation = self._context_generation(session_id)
+        
+        recent = deque(maxlen=self.CONTEXT_HISTORY)
+        for timestamp, role, message in self.get_recent_conversations(
+                limit=self.CONTEXT_HISTORY, session_id=session_id):
+            recent.append(self._format_recent(datetime.fromisoformat(timestamp), role, message))
+        
+        snapshot = {
+            'count': self.get_interaction_count(session_id),
+            'user_info': self.get_user_info(session_id=session_id),
+            'facts_count': self.get_facts_count(session_id),
+            'recent': recent,
+            'summaries': deque(self.get_summaries(self.CONTEXT_SUMMARIES, session_id),
+                               maxlen=self.CONTEXT_SUMMARIES),
+            'generation': generation
+        }
+        
+        with self._cache_lock:
+            self.context_cache_misses += 1
+            if self._context_generation(session_id) == generation:
+                self._context_cache[session_id] = snapshot
+                while len(self._context_cache) > self.CONTEXT_CACHE_SESSIONS:
+                    self._context_cache.popitem(last=False)
+        return snapshot
+    
+    def _context_generation(self, session_id):
+        """Write generation of a session (call with _cache_lock held)"""
+        return self._context_epoch, self._context_generations.get(session_id, 0)
+    
+    def _touch_context(self, session_id):
+        """Record a write to a session, so loads running now aren't cached"""
+        with self._cache_lock:
+            self._context_generations[session_id] = self._context_generations.get(session_id, 0) + 1
+            generation = self._context_generation(session_id)
+        if getattr(self._local, 'tx_depth', 0):
+            self._local.tx_sessions.setdefault(session_id, generation)
+    
+    def _committed_context(self, sessions):
+        """
+        Drop snapshots other threads read while a transaction was open
+        
+        Args:
+            sessions: Dict of session id -> generation of the
+                      transaction's first write to it
+        """
+        for session_id, first_write in sessions.items():
+            with self._cache_lock:
+                self._touch_context(session_id)
+                snapshot = self._context_cache.get(session_id)
+                # Loaded after the write began, so without its uncommitted rows
+                if snapshot and snapshot['generation'] >= first_write:
+                    del self._context_cache[session_id]
+    
+    @staticmethod
+    def _format_recent(when, role, message):
+        """Format one history line of the context summary"""
+        role_char = 'U' if role == 'user' else 'G'
+        return f"[{when.strftime('%H:%M')}] {role_char}: {message}\n"
+    
+    def invalidate_context_cache(self, session_id=None):
+        """Drop cached context (one session, or all) so it's re-read"""
+        with self._cache_lock:
+            if session_id is None:
+                self._context_cache.clear()
+                self._procedures_cache = None
+                self._context_epoch += 1
+            else:
+                self._context_cache.pop(session_id, None)
+                self._touch_context(session_id)
+    
+    def get_context_cache_stats(self):
+        """Get context cache hit/miss counters"""
+        with self._cache_lock:
+            total = self.context_cache_hits + self.context_cache_misses
+            return {
+                'hits': self.context_cache_hits,
+                'misses': self.context_cache_misses,
+                'hit_rate': self.context_cache_hits / total if total else 0.0,
+                'sessions': len(self._context_cache)
+            }
+    
     # ==================== CLEANUP ====================
     
     def close(self):
-        """Close database connection"""
-        if self.conn:
-            self.conn.close()
+        """Close database connections of all threads (for good)"""
+        self._closed = True
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+        self._shared_conn = None
     
-    def export_all(self):
-        """Export all memory as JSON (for debugging)"""
+    def export_all(self, session_id=DEFAULT_SESSION):
+        """Export all memory of a session as JSON (for debugging)"""
         return {
             'metadata': {
-                'interaction_count': self.get_metadata('interaction_count'),
+                'session_id': session_id,
+                'interaction_count': self.get_interaction_count(session_id),
                 'first_interaction': self.get_metadata('first_interaction')
             },
-            'user_info': self.get_user_info(),
+            'user_info': self.get_user_info(session_id=session_id),
             'settings': self._get_all_settings(),
-            'facts': self.get_all_facts(),
+            'facts': self.get_all_facts(session_id),
             'procedures': self.get_all_procedures(),
-            'recent_conversations': self.get_recent_conversations(limit=20)
+            'recent_conversations': self.get_recent_conversations(limit=20, session_id=session_id),
+            'summaries': self.get_summaries(session_id=session_id)
         }
     
     def _get_all_settings(self):
@@ -0,0 +1,194 @@
+"""
+Memory Journal for Gena AI
+Append-only change log with snapshot compaction for GenaAI's JSON memory
+"""
+
+import json
+import os
+from pathlib import Path
+
+
+def set_op(path, value):
+    """Change record: set the value at path (list of keys)"""
+    return {'op': 'set', 'path': path, 'value': value}
+
+
+def append_op(path, value, keep=None):
+    """Change record: append to the list at path, keeping the last `keep` items"""
+    record = {'op': 'append', 'path': path, 'value': value}
+    if keep is not None:
+        record['keep'] = keep
+    return record
+
+
+def apply_op(data, record):
+    """Apply a change record to a memory dict"""
+    *parents, key = record['path']
+    target = data
+    for name in parents:
+        target = target.setdefault(name, {})
+    
+    if record['op'] == 'set':
+        target[key] = record['value']
+    elif record['op'] == 'append':
+        items = target.setdefault(key, [])
+        items.append(record['value'])
+        keep = record.get('keep')
+        if keep is not None and len(items) > keep:
+            del items[:-keep]
+    else:
+        raise ValueError(f"Unknown journal op: {record['op']}")
+
+
+class MemoryJournal:
+    """
+    Journaled storage for a JSON memory dict
+    
+    The memory lives in a snapshot file (e.g. gena_memory.json) plus a
+    journal next to it with one compact JSON line per change, so saving a
+    change costs the size of the change, not of the whole memory. Loading
+    replays the journal over the snapshot; a line cut short by a crash is
+    dropped. Every compact_every records the memory is written to a new
+    snapshot that atomically replaces the old one, and the journal starts
+    over.
+    
+    Records are numbered and the snapshot stores the last number it
+    includes, so a crash between replacing the snapshot and clearing the
+    journal can't apply a change twice.
+    
+    Usage:
+        journal = MemoryJournal("gena_memory.json")
+        memory = journal.load(default_memory)
+        memory['learned_facts'][topic] = entry
+        journal.record([set_op(['learned_facts', topic], entry)], memory)
+    """
+    
+    # Snapshot key holding the last record number it includes
+    SEQ_KEY = "_journal_seq"
+    
+    def __init__(self, path, compact_every=500, fsync=False):
+        """
+        Args:
+            path: Snapshot file; the journal is this path + ".journal"
+            compact_every: Records after which a new snapshot is written
+            fsync: Sync the journal to disk on every write (survives power
+                   loss, not just a crash of the process)
+        """
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self.compact_every = compact_every
+        self.fsync = fsync
+        
+        self.seq = 0
+        self.records = 0  # Records in the journal
+        self.compactions = 0
+        self._file = None
+    
+    def load(self, default):
+        """
+        Read the snapshot and replay the journal
+        
+        Args:
+            default: Function returning a fresh memory dict, used if there
+                     is no readable snapshot
+        
+        Returns:
+            Memory dict
+        """
+        data = None
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = None
+        if not isinstance(data, dict):
+            data = default()
+        self.seq = data.pop(self.SEQ_KEY, 0)
+        
+        self.records = 0
+        if self.journal_path.exists():
+            valid = 0
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # Torn write at the end
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    valid += len(line)
+                    self.records += 1
+                    if record['seq'] > self.seq:
+                        apply_op(data, record)
+                        self.seq = record['seq']
+            
+            # New records go right after the last complete one
+            os.truncate(self.journal_path, valid)
+        
+        return data
+    
+    def record(self, changes, data):
+        """
+        Append changes already made to the memory dict
+        
+        Args:
+            changes: Records from set_op/append_op
+            data: The memory dict, written as a snapshot when it's time
+                  to compact
+        """
+        lines = []
+        for change in changes:
+            self.seq += 1
+            record = dict(change, seq=self.seq)
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+        
+        if self._file is None:
+            self._file = open(self.journal_path, 'ab')
+        # One write per call, so a crash tears at most the last line
+        self._file.write("".join(lines).encode('utf-8'))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.records += len(lines)
+        
+        if self.records >= self.compact_every:
+            self.compact(data)
+    
+    def compact(self, data):
+        """Write the whole memory as the new snapshot and clear the journal"""
+        snapshot = dict(data)
+        snapshot[self.SEQ_KEY] = self.seq
+        
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        
+        # Records up to self.seq are in the snapshot now
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        with open(self.journal_path, 'wb'):
+            pass
+        self.records = 0
+        self.compactions += 1
+    
+    def get_stats(self):
+        """Get journal counters"""
+        return {
+            'records': self.records,
+            'seq': self.seq,
+            'compactions': self.compactions,
+            'journal_bytes': self.journal_path.stat().st_size if self.journal_path.exists() else 0
+        }
+    
+    def close(self, data=None):
+        """Close the journal, writing a final snapshot if data is given"""
+        if data is not None and self.records:
+            self.compact(data)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,195 @@
+"""
+Prompt Builder for Gena AI
+Packs system prompt, memory and history into the engine's context window
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class TokenCounter:
+    """
+    Counts tokens of prompt pieces
+    
+    Uses the engine's tokenizer when it has one (llama-server /tokenize),
+    otherwise a conservative characters-per-token estimate. Counts are
+    cached by text, so the static prefix and history lines are only
+    tokenized once. Text that is new every turn (memory sections, the
+    user's message) is estimated instead, since each tokenizer call is a
+    round trip to the server.
+    """
+    
+    # Estimate errs on the high side (English BPE is ~4 chars/token)
+    CHARS_PER_TOKEN = 3
+    
+    def __init__(self, tokenize_fn=None, cache_size=4096):
+        """
+        Args:
+            tokenize_fn: Callable returning the tokens of a text (e.g.
+                         engine.tokenize), or None to always estimate
+            cache_size: Texts whose counts are kept
+        """
+        self.tokenize_fn = tokenize_fn
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def estimate(cls, text):
+        """Approximate token count without a tokenizer"""
+        return -(-len(text) // cls.CHARS_PER_TOKEN)
+    
+    def count(self, text, exact=True):
+        """
+        Token count of a text
+        
+        Args:
+            text: Text to count
+            exact: Use the tokenizer (pass False for text that won't
+                   come again, to estimate without a request)
+        """
+        if not text:
+            return 0
+        if not exact:
+            return self.estimate(text)
+        
+        with self._lock:
+            if text in self._cache:
+                self._cache.move_to_end(text)
+                return self._cache[text]
+        
+        if self.tokenize_fn is None:
+            count = self.estimate(text)
+        else:
+            try:
+                count = len(self.tokenize_fn(text))
+            except Exception:
+                # Backend not reachable: estimate, but don't cache it
+                return self.estimate(text)
+        
+        with self._lock:
+            self._cache[text] = count
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return count
+
+
+class PromptBuilder:
+    """
+    Greedy prompt packer
+    
+    The budget is the engine's context window minus the tokens reserved
+    for the response (and a small margin). The prefix and the user's
+    message always go in; memory sections are added in priority order if
+    they fit, then as much recent history as fits, newest first. Nothing
+    is sent that the backend would truncate anyway.
+    """
+    
+    def __init__(self, engine, counter=None, margin=32):
+        """
+        Args:
+            engine: Backend engine (used for get_context_limits and,
+                    if it has one, its tokenizer)
+            counter: TokenCounter to use (default: one for this engine)
+            margin: Tokens left unused to absorb counting differences
+                    between pieces and the joined prompt
+        """
+        self.engine = engine
+        self._counter = counter
+        self.margin = margin
+        self.last_usage = {}
+    
+    @property
+    def counter(self):
+        """TokenCounter used for prompts"""
+        # Created on first use, so an engine that is still starting
+        # (DeferredEngine) isn't touched when Gena is constructed
+        if self._counter is None:
+            self._counter = TokenCounter(getattr(self.engine, 'tokenize', None))
+        return self._counter
+    
+    def get_budget(self):
+        """Tokens available for the prompt"""
+        if hasattr(self.engine, 'get_context_limits'):
+            window, response_tokens = self.engine.get_context_limits()
+        else:
+            window, response_tokens = 2048, 256
+        return max(0, window - response_tokens - self.margin)
+    
+    def build(self, prefix, user_message, sections=(), history=()):
+        """
+        Assemble a prompt that fits the budget
+        
+        Args:
+            prefix: Static prompt start, always kept and always first
+            user_message: User's message (shortened from the front only if
+                          it can't fit on its own)
+            sections: Memory blocks in priority order; each is kept whole
+                      or left out
+            history: Formatted history lines, oldest first
+        
+        Returns:
+            Prompt string
+        """
+        budget = self.get_budget()
+        used = self.counter.count(prefix)
+        
+        # Sections and the message change every turn: estimated (high),
+        # the prefix and history lines come again and are tokenized
+        user_message = self._fit_message(user_message, budget - used)
+        tail = f"\n\nUser: {user_message}\nGena:"
+        used += self.counter.count(tail, exact=False)
+        
+        kept = []
+        dropped = 0
+        for section in sections:
+            if not section:
+                continue
+            cost = self.counter.count(section, exact=False)
+            if used + cost <= budget:
+                kept.append(section)
+                used += cost
+            else:
+                dropped += 1
+        
+        lines = []
+        header = "Recent:\n"
+        if history:
+            used += self.counter.count(header)
+            for line in reversed(history):
+                cost = self.counter.count(line)
+                if used + cost > budget:
+                    break
+                lines.append(line)
+                used += cost
+            if lines:
+                kept.append(header + "".join(reversed(lines)))
+            else:
+                used -= self.counter.count(header)
+        
+        self.last_usage = {
+            'budget': budget,
+            'used': used,
+            'history_lines': len(lines),
+            'history_dropped': len(history) - len(lines),
+            'sections_dropped': dropped
+        }
+        return f"{prefix}{''.join(kept)}{tail}"
+    
+    def _fit_message(self, message, available):
+        """Cut a message from the front until it fits the available tokens"""
+        # Room for the "User:/Gena:" framing around it
+        available -= 8
+        if self.counter.count(message, exact=False) <= available:
+            return message
+        if available <= 0:
+            return ""
+        
+        # Keep the end, where the actual question usually is
+        keep = available * TokenCounter.CHARS_PER_TOKEN
+        while keep > 0:
+            cut = "..." + message[-keep:]
+            if self.counter.count(cut, exact=False) <= available:
+                return cut
+            keep = keep * 3 // 4
+        return ""
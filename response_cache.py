@@ -0,0 +1,163 @@
+"""
+Response Cache for Gena AI
+Reuses answers to repeated prompts instead of generating them again
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Two-tier cache of engine responses
+    
+    Keys combine the model, its sampling options and the normalized
+    prompt. Entries live in an in-memory LRU and, if db_path is given, in
+    a SQLite table that survives restarts. Both tiers expire entries
+    after ttl seconds. Sampling above max_temperature is random enough
+    that callers should not cache it (see is_cacheable).
+    """
+    
+    def __init__(self, max_entries=1024, ttl=3600, db_path=None, max_temperature=0.3):
+        """
+        Args:
+            max_entries: Responses kept in memory
+            ttl: Seconds an entry stays valid
+            db_path: Optional SQLite file for the persistent tier
+            max_temperature: Highest temperature whose responses are cached
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        
+        self._entries = OrderedDict()  # key -> (expires_at, response)
+        self._lock = threading.Lock()
+        
+        # Stats
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        
+        self.conn = None
+        if db_path:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode = WAL')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT,
+                    expires_at REAL
+                )
+            ''')
+            self.conn.execute('DELETE FROM response_cache WHERE expires_at < ?', (time.time(),))
+            self.conn.commit()
+    
+    # ==================== KEYS ====================
+    
+    @staticmethod
+    def normalize(prompt):
+        """Prompt with whitespace differences removed"""
+        return re.sub(r'\s+', ' ', prompt).strip()
+    
+    def make_key(self, config, prompt):
+        """
+        Cache key for a prompt
+        
+        Args:
+            config: Model and sampling options (engine.get_sampling_config())
+            prompt: Prompt text
+        """
+        data = json.dumps([config, self.normalize(prompt)], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+    
+    def is_cacheable(self, config):
+        """True if responses for these sampling options may be cached"""
+        if config.get('temperature', 0) > self.max_temperature:
+            with self._lock:
+                self.bypassed += 1
+            return False
+        return True
+    
+    # ==================== LOOKUP ====================
+    
+    def get(self, key):
+        """Cached response for a key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            
+            if self.conn is not None:
+                row = self.conn.execute(
+                    'SELECT response, expires_at FROM response_cache WHERE key = ?', (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+            
+            self.misses += 1
+            return None
+    
+    def put(self, key, response):
+        """Store a response"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, response)
+            if self.conn is not None:
+                self.conn.execute('''
+                    INSERT INTO response_cache (key, response, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        response = excluded.response,
+                        expires_at = excluded.expires_at
+                ''', (key, response, expires_at))
+                self.conn.commit()
+    
+    def _remember(self, key, expires_at, response):
+        """Add to the in-memory tier (caller holds the lock)"""
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    # ==================== STATS / CLEANUP ====================
+    
+    def get_stats(self):
+        """Get hit/miss counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._entries)
+            }
+    
+    def clear(self):
+        """Drop all cached responses"""
+        with self._lock:
+            self._entries.clear()
+            if self.conn is not None:
+                self.conn.execute('DELETE FROM response_cache')
+                self.conn.commit()
+    
+    def close(self):
+        """Close the persistent tier"""
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
@@ -0,0 +1,665 @@
+#!/usr/bin/env python3
+"""
+Storage Backends for Gena AI
+Common memory interface over the SQLite (memory.py) and JSON (gena_core)
+stores, plus bulk import/export between the two
+
+Usage:
+    python storage.py import memory.db gena_memory.json [more.json ...]
+    python storage.py export memory.db gena_memory.json [session_id]
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Protocol, runtime_checkable
+
+from memory import DEFAULT_SESSION, Memory
+from memory_journal import MemoryJournal, append_op, apply_op, set_op
+
+
+@runtime_checkable
+class MemoryBackend(Protocol):
+    """
+    What GenaAI needs from its memory store
+    
+    Memory (SQLite) and JsonMemory both provide it. Gena uses the full
+    Memory class on top of this (context snapshots, compaction, search).
+    Backends that hold a single conversation ignore session_id.
+    """
+    
+    def transaction(self):
+        """Context manager grouping writes into one commit"""
+        ...
+    
+    def get_interaction_count(self, session_id=DEFAULT_SESSION):
+        ...
+    
+    def increment_interaction_count(self, session_id=DEFAULT_SESSION):
+        ...
+    
+    def get_user_info(self, key=None, session_id=DEFAULT_SESSION):
+        ...
+    
+    def set_user_info(self, key, value, session_id=DEFAULT_SESSION):
+        ...
+    
+    def get_all_facts(self, session_id=DEFAULT_SESSION):
+        ...
+    
+    def get_facts_count(self, session_id=DEFAULT_SESSION):
+        ...
+    
+    def learn_fact(self, topic, content, session_id=DEFAULT_SESSION):
+        ...
+    
+    def get_all_procedures(self):
+        ...
+    
+    def get_procedures_list(self):
+        ...
+    
+    def learn_procedure(self, name, steps):
+        ...
+    
+    def add_message(self, role, message, session_id=DEFAULT_SESSION):
+        ...
+    
+    def get_recent_lines(self, session_id=DEFAULT_SESSION, limit=None):
+        """History lines formatted like "[12:30] U: hello\\n", oldest first"""
+        ...
+    
+    def clear_old_conversations(self, keep_last=20, session_id=DEFAULT_SESSION):
+        ...
+    
+    def close(self):
+        ...
+
+
+class JsonMemory:
+    """
+    MemoryBackend over a JSON memory file (gena_memory.json)
+    
+    The file holds one conversation, so session_id arguments are
+    accepted and ignored. Changes are appended to a journal next to the
+    file (see MemoryJournal); with journal=False every change rewrites
+    the whole file instead.
+    """
+    
+    # Conversation lines kept
+    HISTORY_LINES = 20
+    
+    def __init__(self, path="gena_memory.json", journal=True, compact_every=500):
+        """
+        Args:
+            path: JSON memory file
+            journal: Journal changes instead of rewriting the file
+            compact_every: Journal records after which the file is rewritten
+        """
+        self.path = Path(path)
+        self.journal = MemoryJournal(path, compact_every) if journal else None
+        self.data = self.load()
+        
+        self._tx_depth = 0
+        self._pending = []
+    
+    # ==================== FILE ====================
+    
+    @staticmethod
+    def default_memory():
+        """Initialize memory structure"""
+        return {
+            "user_info": {},
+            "preferences": {},
+            "learned_facts": {},
+            "learned_procedures": {},
+            "conversation_history": [],
+            "interaction_count": 0,
+            "first_interaction": datetime.now().isoformat(),
+        }
+    
+    def load(self):
+        """Load persistent memory"""
+        if self.journal is not None:
+            return self.journal.load(self.default_memory)
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                data.pop(MemoryJournal.SEQ_KEY, None)
+                return data
+            except (OSError, ValueError):
+                return self.default_memory()
+        return self.default_memory()
+    
+    def save(self):
+        """Write the whole memory to the file"""
+        if self.journal is not None:
+            self.journal.compact(self.data)
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+    
+    def _record(self, *changes):
+        """Persist changes already made to self.data"""
+        if self._tx_depth:
+            self._pending.extend(changes)
+        elif self.journal is not None:
+            self.journal.record(changes, self.data)
+        else:
+            self.save()
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Write the changes made inside the block together on exit
+        
+        There is no rollback: changes are already in self.data, so they
+        are written even if the block raises.
+        """
+        self._tx_depth += 1
+        try:
+            yield self
+        finally:
+            self._tx_depth -= 1
+            if self._tx_depth == 0 and self._pending:
+                changes, self._pending = self._pending, []
+                self._record(*changes)
+    
+    # ==================== SESSIONS ====================
+    
+    def get_interaction_count(self, session_id=DEFAULT_SESSION):
+        """Get number of chats"""
+        return self.data['interaction_count']
+    
+    def increment_interaction_count(self, session_id=DEFAULT_SESSION):
+        """Increment and return interaction count"""
+        self.data['interaction_count'] += 1
+        self._record(set_op(['interaction_count'], self.data['interaction_count']))
+        return self.data['interaction_count']
+    
+    # ==================== USER INFO ====================
+    
+    def get_user_info(self, key=None, session_id=DEFAULT_SESSION):
+        """Get user info (all or specific key)"""
+        if key:
+            return self.data['user_info'].get(key)
+        return dict(self.data['user_info'])
+    
+    def set_user_info(self, key, value, session_id=DEFAULT_SESSION):
+        """Set user info"""
+        self.data['user_info'][key] = value
+        self._record(set_op(['user_info', key], value))
+    
+    # ==================== FACTS / PROCEDURES ====================
+    
+    def get_all_facts(self, session_id=DEFAULT_SESSION):
+        """Get all learned facts"""
+        return {topic: entry['content'] for topic, entry in self.data['learned_facts'].items()}
+    
+    def get_facts_count(self, session_id=DEFAULT_SESSION):
+        """Get number of learned facts"""
+        return len(self.data['learned_facts'])
+    
+    def learn_fact(self, topic, content, session_id=DEFAULT_SESSION):
+        """Learn and remember a fact"""
+        entry = {
+            "content": content,
+            "learned_at": datetime.now().isoformat()
+        }
+        self.data['learned_facts'][topic] = entry
+        self._record(set_op(['learned_facts', topic], entry))
+        return f"Got it! I'll remember that about {topic}."
+    
+    def get_all_procedures(self):
+        """Get all learned procedures"""
+        return {name: entry['steps'] for name, entry in self.data['learned_procedures'].items()}
+    
+    def get_procedures_list(self):
+        """Get list of procedure names"""
+        return sorted(self.data['learned_procedures'])
+    
+    def learn_procedure(self, name, steps):
+        """Learn a procedure"""
+        entry = {
+            "steps": steps,
+            "learned_at": datetime.now().isoformat()
+        }
+        self.data['learned_procedures'][name] = entry
+        self._record(set_op(['learned_procedures', name], entry))
+        return f"Yay! I learned how to {name}!"
+    
+    # ==================== CONVERSATION HISTORY ====================
+    
+    def add_message(self, role, message, session_id=DEFAULT_SESSION):
+        """Add message to conversation history"""
+        line = format_history_line(datetime.now(), role, message)
+        history = self.data['conversation_history']
+        history.append(line)
+        if len(history) > self.HISTORY_LINES:
+            del history[:-self.HISTORY_LINES]
+        self._record(append_op(['conversation_history'], line, keep=self.HISTORY_LINES))
+    
+    def get_recent_lines(self, session_id=DEFAULT_SESSION, limit=None):
+        """Recent history lines, oldest first"""
+        history = self.data['conversation_history']
+        if limit is not None:
+            history = history[-limit:] if limit else []
+        return [f"{line}\n" for line in history]
+    
+    def clear_old_conversations(self, keep_last=20, session_id=DEFAULT_SESSION):
+        """Keep only recent conversations"""
+        if len(self.data['conversation_history']) > keep_last:
+            self.data['conversation_history'] = self.data['conversation_history'][-keep_last:]
+            self._record(set_op(['conversation_history'], self.data['conversation_history']))
+    
+    # ==================== CLEANUP ====================
+    
+    def close(self):
+        """Write a final snapshot and close the journal"""
+        if self.journal is not None:
+            self.journal.close(self.data)
+
+
+# ==================== HISTORY LINES ====================
+
+# "[12:30] U: hello" (GenaAI's conversation_history format)
+HISTORY_LINE = re.compile(r'\[(\d{1,2}):(\d{2})\] ([UG]): (.*)\Z', re.DOTALL)
+
+
+def format_history_line(when, role, message):
+    """One conversation_history entry"""
+    role_char = 'U' if role == 'user' else 'G'
+    return f"[{when.strftime('%H:%M')}] {role_char}: {message}"
+
+
+# ==================== STREAMING JSON ====================
+
+WHITESPACE = re.compile(r'\s*')
+
+
+class JsonStream:
+    """
+    Reads a JSON document piece by piece
+    
+    Only the current value has to fit in memory: members() and
+    elements() step through an object or array without decoding it
+    whole.
+    """
+    
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+    
+    def _read(self):
+        """Append the next chunk to the buffer; False at end of file"""
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+    
+    def peek(self):
+        """Next non-whitespace character ('' at end of file)"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return ''
+    
+    def expect(self, char):
+        """Consume a structural character"""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r}")
+        self.pos += 1
+    
+    def value(self):
+        """Decode the next complete value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the very end may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read()
+    
+    def _items(self, opening, closing):
+        """Position at each item of the object/array that comes next"""
+        self.expect(opening)
+        if self.peek() == closing:
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == closing:
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or {closing!r} but found {char!r}")
+    
+    def members(self):
+        """
+        Keys of the object that comes next
+        
+        The caller reads (or walks) each member's value before asking for
+        the next key.
+        """
+        for _ in self._items('{', '}'):
+            key = self.value()
+            self.expect(':')
+            yield key
+    
+    def elements(self):
+        """Step through the array that comes next (caller reads each value)"""
+        yield from self._items('[', ']')
+
+
+def iter_json_memory(path, chunk_size=1 << 16):
+    """
+    Stream the entries of a JSON memory file and its journal
+    
+    Yields:
+        (section, key, value) tuples: object sections (learned_facts,
+        user_info, ...) give one tuple per member, lists one per item with
+        key None, and plain values like interaction_count one tuple with
+        key None. Journal changes follow the file's own entries; list
+        items (the trimmed history) come last, once the journal's appends
+        and replacements have been applied to them.
+    """
+    path = Path(path)
+    seq = 0
+    lists = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = JsonStream(f, chunk_size)
+        for section in stream.members():
+            char = stream.peek()
+            if char == '{':
+                for key in stream.members():
+                    yield section, key, stream.value()
+            elif char == '[':
+                lists[section] = [stream.value() for _ in stream.elements()]
+            elif section == MemoryJournal.SEQ_KEY:
+                seq = stream.value()
+            else:
+                yield section, None, stream.value()
+    
+    journal_path = path.with_name(path.name + ".journal")
+    if journal_path.exists():
+        with open(journal_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Torn write at the end
+                record = json.loads(line)
+                if record['seq'] <= seq:
+                    continue
+                section, *rest = record['path']
+                if record['op'] == 'append' or (not rest and isinstance(record['value'], list)):
+                    # Appends keep only the last `keep` items; replay them
+                    apply_op(lists, record)
+                    continue
+                yield section, rest[0] if rest else None, record['value']
+    
+    for section, items in lists.items():
+        for item in items:
+            yield section, None, item
+
+
+# ==================== IMPORT / EXPORT ====================
+
+IMPORT_SQL = {
+    'user_info': '''
+        INSERT OR REPLACE INTO user_info (session_id, key, value, updated_at)
+        VALUES (?, ?, ?, ?)
+    ''',
+    'settings': '''
+        INSERT OR REPLACE INTO settings (key, value, updated_at)
+        VALUES (?, ?, ?)
+    ''',
+    # Upserts (not REPLACE) so the search index triggers see updates
+    'facts': '''
+        INSERT INTO facts (session_id, topic, content, learned_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(session_id, topic) DO UPDATE SET
+            content = excluded.content,
+            learned_at = excluded.learned_at
+    ''',
+    'procedures': '''
+        INSERT INTO procedures (name, steps, learned_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            steps = excluded.steps,
+            learned_at = excluded.learned_at
+    ''',
+    'conversations': '''
+        INSERT INTO conversations (session_id, timestamp, role, message)
+        VALUES (?, ?, ?, ?)
+    ''',
+}
+
+
+def _text(value):
+    """Value as stored in a TEXT column"""
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+def import_json_memory(memory, path, session_id=DEFAULT_SESSION, batch_size=1000):
+    """
+    Copy a JSON memory file (and its journal) into a SQLite Memory
+    
+    The file is streamed, and rows are inserted with executemany in
+    batches of batch_size, all inside one transaction, so a failed
+    import leaves the database unchanged. Facts, user info and history
+    go to session_id; procedures and preferences (as settings) are
+    shared. Interaction counts add up, so several files can be merged
+    into one session. Memory.on_fact_learned is not called for imported
+    facts.
+    
+    Args:
+        memory: Memory instance
+        path: JSON memory file
+        session_id: Session to import into
+        batch_size: Rows per executemany call
+    
+    Returns:
+        Dict with the number of rows written per table (plus 'skipped'
+        history lines that couldn't be parsed)
+    """
+    path = Path(path)
+    # History lines only have a time of day; the file was last written
+    # on the day the newest ones were said
+    day = datetime.fromtimestamp(path.stat().st_mtime).date()
+    now = datetime.now().isoformat()
+    
+    batches = {table: [] for table in IMPORT_SQL}
+    counts = dict.fromkeys(IMPORT_SQL, 0)
+    counts['skipped'] = 0
+    scalars = {}
+    conn = memory.conn
+    
+    def flush(table):
+        conn.executemany(IMPORT_SQL[table], batches[table])
+        counts[table] += len(batches[table])
+        batches[table].clear()
+    
+    with memory.transaction():
+        for section, key, value in iter_json_memory(path):
+            if section == 'user_info' and key is not None:
+                table, row = 'user_info', (session_id, key, _text(value), now)
+            elif section == 'preferences' and key is not None:
+                table, row = 'settings', (key, _text(value), now)
+            elif section == 'learned_facts' and key is not None:
+                if isinstance(value, dict):
+                    row = (session_id, key, _text(value.get('content')), value.get('learned_at', now))
+                else:
+                    row = (session_id, key, _text(value), now)
+                table = 'facts'
+            elif section == 'learned_procedures' and key is not None:
+                steps = value.get('steps') if isinstance(value, dict) else value
+                learned_at = value.get('learned_at', now) if isinstance(value, dict) else now
+                table = 'procedures'
+                row = (key, json.dumps(steps if isinstance(steps, list) else [steps]), learned_at)
+            elif section == 'conversation_history':
+                match = HISTORY_LINE.match(value) if isinstance(value, str) else None
+                if not match:
+                    counts['skipped'] += 1
+                    continue
+                hour, minute, role_char, message = match.groups()
+                timestamp = datetime(day.year, day.month, day.day, int(hour), int(minute)).isoformat()
+                table = 'conversations'
+                row = (session_id, timestamp, 'user' if role_char == 'U' else 'assistant', message)
+            else:
+                scalars[section] = value
+                continue
+            
+            batches[table].append(row)
+            if len(batches[table]) >= batch_size:
+                flush(table)
+        
+        for table in batches:
+            flush(table)
+        
+        first = scalars.get('first_interaction') or now
+        conn.execute('''
+            INSERT INTO sessions (session_id, interaction_count, created_at, last_active)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                interaction_count = interaction_count + excluded.interaction_count,
+                created_at = MIN(created_at, excluded.created_at),
+                last_active = MAX(last_active, excluded.last_active)
+        ''', (session_id, int(scalars.get('interaction_count') or 0), first,
+              datetime.fromtimestamp(path.stat().st_mtime).isoformat()))
+        conn.execute('''
+            INSERT INTO metadata (key, value) VALUES ('first_interaction', ?)
+            ON CONFLICT(key) DO UPDATE SET value = MIN(value, excluded.value)
+        ''', (first,))
+    
+    memory.invalidate_context_cache()
+    return counts
+
+
+def _write_object(f, name, items, last=False):
+    """Write one top-level "name": {...} member, member by member"""
+    f.write(f'  {json.dumps(name)}: {{')
+    separator = "\n"
+    for key, value in items:
+        f.write(f'{separator}    {json.dumps(key, ensure_ascii=False)}: {json.dumps(value, ensure_ascii=False)}')
+        separator = ",\n"
+    f.write("\n  }" if separator == ",\n" else "}")
+    f.write("\n" if last else ",\n")
+
+
+def export_json_memory(memory, path, session_id=DEFAULT_SESSION, history=JsonMemory.HISTORY_LINES):
+    """
+    Write a session of a SQLite Memory as a JSON memory file
+    
+    Rows are read with cursors and written one at a time. The file is
+    written next to path and renamed over it when complete.
+    
+    Args:
+        memory: Memory instance
+        path: JSON memory file to write
+        session_id: Session to export
+        history: Most recent conversation lines to include
+    
+    Returns:
+        Number of facts written
+    """
+    path = Path(path)
+    conn = memory.conn
+    facts = 0
+    
+    def fact_items():
+        nonlocal facts
+        cursor = conn.execute(
+            'SELECT topic, content, learned_at FROM facts WHERE session_id = ?', (session_id,)
+        )
+        for row in cursor:
+            facts += 1
+            yield row['topic'], {'content': row['content'], 'learned_at': row['learned_at']}
+    
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("{\n")
+        _write_object(f, 'user_info', (
+            (row['key'], row['value']) for row in conn.execute(
+                'SELECT key, value FROM user_info WHERE session_id = ? ORDER BY key', (session_id,)
+            )
+        ))
+        _write_object(f, 'preferences', (
+            (row['key'], row['value']) for row in conn.execute('SELECT key, value FROM settings')
+        ))
+        _write_object(f, 'learned_facts', fact_items())
+        _write_object(f, 'learned_procedures', (
+            (row['name'], {'steps': json.loads(row['steps']), 'learned_at': row['learned_at']})
+            for row in conn.execute('SELECT name, steps, learned_at FROM procedures')
+        ))
+        
+        lines = [
+            format_history_line(datetime.fromisoformat(timestamp), role, message)
+            for timestamp, role, message in memory.get_recent_conversations(history, session_id)
+        ]
+        f.write(f'  "conversation_history": {json.dumps(lines, indent=4, ensure_ascii=False)},\n')
+        f.write(f'  "interaction_count": {memory.get_interaction_count(session_id)},\n')
+        first = memory.get_metadata('first_interaction') or datetime.now().isoformat()
+        f.write(f'  "first_interaction": {json.dumps(first)}\n')
+        f.write("}\n")
+    os.replace(tmp_path, path)
+    
+    # A journal of the file being replaced would be replayed over it
+    journal_path = path.with_name(path.name + ".journal")
+    if journal_path.exists():
+        journal_path.unlink()
+    return facts
+
+
+def main():
+    if len(sys.argv) < 4 or sys.argv[1] not in ('import', 'export'):
+        print(__doc__.split("Usage:")[1].rstrip())
+        sys.exit(1)
+    
+    memory = Memory(sys.argv[2])
+    try:
+        if sys.argv[1] == 'import':
+            files = sys.argv[3:]
+            for file in files:
+                # Several files: one session per file, named after it
+                session_id = Path(file).stem if len(files) > 1 else DEFAULT_SESSION
+                start = time.perf_counter()
+                try:
+                    counts = import_json_memory(memory, file, session_id)
+                except (OSError, ValueError) as e:
+                    print(f"✗ {file}: {e}")
+                    continue
+                elapsed = time.perf_counter() - start
+                rows = sum(n for table, n in counts.items() if table != 'skipped')
+                print(f"✓ {file} → session '{session_id}': {rows} rows in {elapsed:.2f}s "
+                      f"({counts['facts']} facts, {counts['conversations']} messages)")
+        else:
+            session_id = sys.argv[4] if len(sys.argv) > 4 else DEFAULT_SESSION
+            facts = export_json_memory(memory, sys.argv[3], session_id)
+            print(f"✓ Session '{session_id}' → {sys.argv[3]} ({facts} facts)")
+    finally:
+        memory.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Tool Call Parser for Gena AI
+Finds TOOL[name](args) calls in one pass, also while a response streams in
+"""
+
+import ast
+import json
+import re
+
+
+# After "TOOL[": the tool name, "]" and "(" that open the arguments
+HEADER = re.compile(r'(\w+)\]\(')
+# A header that may still be completed by more text
+PARTIAL_HEADER = re.compile(r'\w*(\]\(?)?\Z')
+
+MARKER = "TOOL["
+
+# Arguments longer than this are treated as text, not a call
+MAX_ARGS_LENGTH = 10000
+
+# Letters that may prefix a Python string literal (f'...', rb"...")
+STRING_PREFIXES = {'r', 'b', 'f', 'u', 'rb', 'br', 'fr', 'rf'}
+# Tools whose arguments are Python code; elsewhere "B's" is a word
+CODE_TOOLS = {'execute_python'}
+
+CLOSING = {'(': ')', '[': ']', '{': '}'}
+
+
+class ToolCall:
+    """One parsed TOOL[name](args) call"""
+    
+    def __init__(self, name, raw_args):
+        """
+        Args:
+            name: Tool name
+            raw_args: Text between the parentheses, unchanged
+        """
+        self.name = name
+        self.raw_args = raw_args
+    
+    def arguments(self, names):
+        """
+        Arguments matched to the tool's parameters
+        
+        Accepts a JSON object ({"topic": ..., "fact": ...}), a JSON array,
+        or plain comma-separated values (quoted or not). Commas inside
+        quotes or brackets don't split, and the last parameter takes the
+        rest of the text.
+        
+        Args:
+            names: Parameter names, in order
+        
+        Returns:
+            List of values, or None if they don't match the parameters
+        """
+        raw = self.raw_args.strip()
+        if raw[:1] in ('{', '['):
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                if all(name in data for name in names):
+                    return [data[name] for name in names]
+                return None
+            if isinstance(data, list) and len(names) > 1:
+                return data if len(data) == len(names) else None
+        
+        values = [unquote(part) for part in split_args(raw, len(names) - 1)]
+        return values if len(values) == len(names) else None
+    
+    def __repr__(self):
+        return f"ToolCall(name={self.name!r}, raw_args={self.raw_args!r})"
+
+
+def split_args(text, maxsplit=-1):
+    """Split on commas outside quotes and brackets"""
+    parts = []
+    start = 0
+    depth = 0
+    quote = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in '"\'' and _opens_string(text, start, i):
+            quote = char
+        elif char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth = max(depth - 1, 0)
+        elif char == ',' and depth == 0 and maxsplit != 0:
+            parts.append(text[start:i])
+            start = i + 1
+            maxsplit -= 1
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+def _opens_string(text, start, i, prefixes=False):
+    """
+    True if the quote at text[i] starts a string, not e.g. an apostrophe
+    
+    With prefixes, a quote after a string prefix (f'...') starts one too.
+    """
+    j = i
+    while j > start and (text[j - 1].isalnum() or text[j - 1] == '_'):
+        j -= 1
+    word = text[j:i]
+    return not word or (prefixes and word.lower() in STRING_PREFIXES)
+
+
+def unquote(value):
+    """Argument value with surrounding whitespace and quotes removed"""
+    value = value.strip()
+    if value[:1] in ('[', '{'):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        try:
+            return str(ast.literal_eval(value))
+        except (ValueError, SyntaxError):
+            pass
+    return value.strip('"').strip("'")
+
+
+class ToolCallParser:
+    """
+    Incremental TOOL[name](args) scanner
+    
+    Feed it response text in chunks of any size; it hands back the text
+    outside tool calls and each call as soon as its closing parenthesis
+    arrives. Parentheses, brackets and braces nest, and anything inside
+    quotes is skipped, so execute_python(math.sqrt(2)) and JSON arguments
+    parse whole. Text that might still turn into a call is held back
+    until it's decided. Every character is looked at once.
+    
+    Usage:
+        parser = ToolCallParser()
+        for chunk in stream:
+            text, calls = parser.feed(chunk)
+        text, calls = parser.close()
+    """
+    
+    def __init__(self):
+        self._buffer = ""
+        self._reset()
+    
+    def _reset(self):
+        """Back to scanning text"""
+        self._name = None    # Tool name once the header is complete
+        self._args_start = 0
+        self._pos = 0        # Next argument character to look at
+        self._stack = []     # Expected closing brackets
+        self._quote = None
+        self._escape = False
+    
+    def feed(self, chunk):
+        """
+        Scan more response text
+        
+        Returns:
+            Tuple of (text outside tool calls, list of completed ToolCalls)
+        """
+        self._buffer += chunk
+        text = []
+        calls = []
+        
+        while True:
+            if self._name is None:
+                # Looking for a call; str.find skips plain text quickly
+                start = self._buffer.find(MARKER)
+                if start < 0:
+                    keep = self._partial_marker()
+                    text.append(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                
+                text.append(self._buffer[:start])
+                self._buffer = self._buffer[start:]
+                
+                match = HEADER.match(self._buffer, len(MARKER))
+                if match is None:
+                    if PARTIAL_HEADER.match(self._buffer, len(MARKER)):
+                        break  # Wait for the rest of the header
+                    text.append(MARKER)
+                    self._buffer = self._buffer[len(MARKER):]
+                    continue
+                
+                self._name = match.group(1)
+                self._args_start = self._pos = match.end()
+            
+            end = self._scan_args()
+            if end is None:
+                if self._pos - self._args_start > MAX_ARGS_LENGTH:
+                    # Runaway quote or bracket: it wasn't a call after all
+                    text.append(MARKER)
+                    self._buffer = self._buffer[len(MARKER):]
+                    self._reset()
+                    continue
+                break
+            
+            calls.append(ToolCall(self._name, self._buffer[self._args_start:end]))
+            self._buffer = self._buffer[end + 1:]
+            self._reset()
+        
+        return "".join(text), calls
+    
+    def _partial_marker(self):
+        """Length of the buffer's end that could be the start of MARKER"""
+        for size in range(min(len(MARKER) - 1, len(self._buffer)), 0, -1):
+            if MARKER.startswith(self._buffer[-size:]):
+                return size
+        return 0
+    
+    def _scan_args(self):
+        """
+        Continue through the arguments
+        
+        Returns:
+            Index of the closing parenthesis, or None if it hasn't arrived
+        """
+        buffer = self._buffer
+        stack = self._stack
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == self._quote:
+                    self._quote = None
+            elif char in '"\'':
+                if _opens_string(buffer, self._args_start, i, self._name in CODE_TOOLS):
+                    self._quote = char
+            elif char in CLOSING:
+                stack.append(CLOSING[char])
+            elif char == ')' and not stack:
+                self._pos = i + 1
+                return i
+            elif stack and char == stack[-1]:
+                stack.pop()
+            i += 1
+        self._pos = i
+        return None
+    
+    def close(self):
+        """
+        End of the response
+        
+        Returns:
+            Tuple of (remaining text, list of completed ToolCalls). An
+            unfinished call is returned as text.
+        """
+        text, calls = self.feed("")
+        text += self._buffer
+        self._buffer = ""
+        self._reset()
+        return text, calls
+
+
+def parse_tool_calls(response):
+    """
+    Parse a complete response
+    
+    Returns:
+        Tuple of (response with tool calls removed, list of ToolCalls)
+    """
+    if MARKER not in response:
+        return response, []
+    parser = ToolCallParser()
+    text, calls = parser.feed(response)
+    rest, more = parser.close()
+    return text + rest, calls + more
@@ -0,0 +1,303 @@
+"""
+Tool Workers for Gena AI
+Runs execute_python code in a pool of sandboxed worker processes
+"""
+
+import ast
+import math
+import multiprocessing
+import queue
+import threading
+import time
+from functools import lru_cache
+from io import StringIO
+
+try:
+    import resource
+except ImportError:  # Windows: run without rlimits
+    resource = None
+
+
+# Longest stdout kept per call
+MAX_OUTPUT = 10000
+
+
+class ExecutionResult:
+    """Outcome of one execute_python call"""
+    
+    def __init__(self, ok, value=None, stdout="", error=None, duration=0.0):
+        """
+        Args:
+            ok: True if the code ran without raising
+            value: str() of the final expression's value (None if the code
+                   didn't end in an expression)
+            stdout: Text the code printed
+            error: Error message if not ok
+            duration: Wall-clock seconds the call took
+        """
+        self.ok = ok
+        self.value = value
+        self.stdout = stdout
+        self.error = error
+        self.duration = duration
+    
+    def __str__(self):
+        """Tool result text, as shown to the user"""
+        if not self.ok:
+            return f"Error: {self.error}"
+        return f"Result: {self.stdout if self.stdout else self.value}"
+    
+    def __repr__(self):
+        return f"ExecutionResult(ok={self.ok!r}, value={self.value!r}, stdout={self.stdout!r}, error={self.error!r})"
+
+
+# Output of the call running in this worker (one call at a time)
+_output = StringIO()
+
+
+def _print(*args, sep=' ', end='\n', file=None, flush=False):
+    """print() for tool code: writes to the current call's output (file and flush are ignored)"""
+    sep = ' ' if sep is None else sep
+    end = '\n' if end is None else end
+    _output.write(sep.join(str(arg) for arg in args) + end)
+
+
+# Built once per worker; each call gets a shallow copy
+BASE_GLOBALS = {
+    '__builtins__': {
+        'abs': abs, 'min': min, 'max': max, 'sum': sum,
+        'round': round, 'len': len, 'range': range,
+        'str': str, 'int': int, 'float': float,
+        'list': list, 'dict': dict, 'print': _print
+    },
+    'math': math
+}
+
+
+@lru_cache(maxsize=256)
+def compile_tool_code(code):
+    """
+    Parse tool code once and compile it for a single run
+    
+    Returns:
+        Tuple of (statements code object or None, final expression code
+        object or None). The final expression is evaluated for its value;
+        everything before it is executed.
+    
+    Raises:
+        SyntaxError: If the code doesn't parse
+    """
+    tree = ast.parse(code, '<tool>', 'exec')
+    
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    
+    body = compile(tree, '<tool>', 'exec') if tree.body else None
+    expr = compile(last, '<tool>', 'eval') if last is not None else None
+    return body, expr
+
+
+def execute(code):
+    """
+    Run tool code and describe the outcome (runs inside a worker)
+    
+    Returns:
+        Dict with ok, value, stdout, error
+    """
+    global _output
+    _output = StringIO()
+    try:
+        body, expr = compile_tool_code(code)
+        
+        # Own builtins too, so code replacing print or len can't
+        # change them for later calls in this worker
+        tool_globals = dict(BASE_GLOBALS)
+        tool_globals['__builtins__'] = dict(BASE_GLOBALS['__builtins__'])
+        if body is not None:
+            exec(body, tool_globals)
+        value = eval(expr, tool_globals) if expr is not None else None
+        
+        value = None if value is None else str(value)
+        return {'ok': True, 'value': value, 'stdout': _output.getvalue()[:MAX_OUTPUT], 'error': None}
+    except MemoryError:
+        return {'ok': False, 'value': None, 'stdout': "", 'error': "Out of memory"}
+    except Exception as e:
+        return {'ok': False, 'value': None, 'stdout': "", 'error': str(e)}
+
+
+def _worker_main(conn, cpu_seconds, memory_mb):
+    """Worker process: run code received over the pipe until closed"""
+    if resource is not None and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    conn.send('ready')
+    
+    while True:
+        try:
+            code = conn.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            return  # Pool closed (or the main process exited)
+        
+        if resource is not None and cpu_seconds:
+            # RLIMIT_CPU counts the whole process life, so allow
+            # cpu_seconds more than this worker has used so far
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = int(usage.ru_utime + usage.ru_stime)
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            soft = used + cpu_seconds
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        
+        conn.send(execute(code))
+
+
+class PythonWorkerPool:
+    """
+    Pre-started worker processes for execute_python
+    
+    Code runs outside the main process with CPU-time and memory rlimits
+    (where available) and a wall-clock timeout. A worker that times out
+    or dies is replaced, so a runaway snippet costs one worker restart
+    instead of hanging the assistant. Calls from several threads run in
+    parallel, one per worker.
+    
+    Workers are spawned (fresh interpreters importing the main module),
+    so a script that chats with Gena must do so under
+    `if __name__ == "__main__":`, or its workers fail to start.
+    """
+    
+    # Seconds a new worker may take to report it's ready
+    START_TIMEOUT = 30
+    
+    def __init__(self, workers=2, timeout=5.0, cpu_seconds=5, memory_mb=256):
+        """
+        Args:
+            workers: Worker processes
+            timeout: Wall-clock seconds a call may take
+            cpu_seconds: CPU seconds a call may use (RLIMIT_CPU)
+            memory_mb: Address space limit per worker (RLIMIT_AS)
+        """
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        
+        # Fresh interpreters: a forked copy of the main process would
+        # already exceed the memory limit with its mapped files
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        
+        # Stats
+        self.calls = 0
+        self.timeouts = 0
+        self.restarts = 0
+        
+        for _ in range(workers):
+            self._idle.put(self._start_worker())
+    
+    def _start_worker(self):
+        """Start one worker process"""
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.cpu_seconds, self.memory_mb),
+            name="gena-tool-worker",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        
+        worker = {'process': process, 'conn': parent_conn, 'ready': False}
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+    
+    def _replace_worker(self, worker):
+        """Kill a worker and start a new one in its place"""
+        worker['process'].kill()
+        worker['process'].join()
+        worker['conn'].close()
+        with self._lock:
+            self._workers.remove(worker)
+            self.restarts += 1
+        return self._start_worker()
+    
+    def _wait_ready(self, worker):
+        """Wait for a new worker's ready message (EOFError if it didn't start)"""
+        if not worker['conn'].poll(self.START_TIMEOUT) or worker['conn'].recv() != 'ready':
+            raise EOFError("Worker didn't start")
+        worker['ready'] = True
+    
+    def run(self, code):
+        """
+        Run tool code in a worker
+        
+        Args:
+            code: Python source
+        
+        Returns:
+            ExecutionResult
+        """
+        if self._closed:
+            raise RuntimeError("Worker pool is closed")
+        
+        worker = self._idle.get()
+        start = time.perf_counter()
+        try:
+            if not worker['ready']:
+                self._wait_ready(worker)
+        except (EOFError, OSError):
+            # Usually the main module starting Gena again on import
+            worker = self._replace_worker(worker)
+            self._idle.put(worker)
+            self.calls += 1
+            return ExecutionResult(False, error="Tool worker failed to start (is the script's code under "
+                                                "if __name__ == \"__main__\"?)",
+                                   duration=time.perf_counter() - start)
+        
+        try:
+            worker['conn'].send(code)
+            if worker['conn'].poll(self.timeout):
+                data = worker['conn'].recv()
+                result = ExecutionResult(duration=time.perf_counter() - start, **data)
+            else:
+                self.timeouts += 1
+                worker = self._replace_worker(worker)
+                result = ExecutionResult(False, error=f"Timed out after {self.timeout:g}s",
+                                         duration=time.perf_counter() - start)
+        except (EOFError, OSError):
+            # Worker died, e.g. killed for exceeding its CPU limit
+            worker = self._replace_worker(worker)
+            result = ExecutionResult(False, error="Worker stopped (CPU or memory limit exceeded?)",
+                                     duration=time.perf_counter() - start)
+        finally:
+            self._idle.put(worker)
+        
+        self.calls += 1
+        return result
+    
+    def get_stats(self):
+        """Get call counters"""
+        return {
+            'workers': len(self._workers),
+            'calls': self.calls,
+            'timeouts': self.timeouts,
+            'restarts': self.restarts
+        }
+    
+    def close(self):
+        """Stop all workers"""
+        self._closed = True
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker['conn'].close()  # Worker exits on EOF
+        for worker in workers:
+            worker['process'].join(timeout=1)
+            if worker['process'].is_alive():
+                worker['process'].kill()
+                worker['process'].join()
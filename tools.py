@@ -3,8 +3,10 @@ Tools System for Gena AI
 All available tools and their implementations
 """
 
-import sys
-from io import StringIO
+import threading
+
+from tool_parser import parse_tool_calls
+from tool_workers import PythonWorkerPool
 
 
 class Tools:
@@ -22,54 +24,53 @@ TOOLS AVAILABLE:
 To use a tool, respond with: TOOL[tool_name](args)
 Example: TOOL[execute_python](2 + 2)
 """
+
+    # Tools that only compute a result: they may run while a response is
+    # still streaming. The rest write memory and run with the turn's writes.
+    SIDE_EFFECT_FREE = ("execute_python",)
+    
+    @staticmethod
+    def is_side_effect_free(call):
+        """Whether a parsed tool call can run before the turn is committed"""
+        return call.name in Tools.SIDE_EFFECT_FREE
+    
+    # Worker processes for execute_python (started on first use)
+    _worker_pool = None
+    _pool_lock = threading.Lock()
+    
+    @staticmethod
+    def get_worker_pool():
+        """Shared PythonWorkerPool, started on first use"""
+        with Tools._pool_lock:
+            if Tools._worker_pool is None:
+                Tools._worker_pool = PythonWorkerPool()
+            return Tools._worker_pool
+    
+    @staticmethod
+    def run_python(code):
+        """
+        Run Python code in a sandboxed worker process
+        
+        Returns:
+            ExecutionResult (value, stdout, error, duration)
+        """
+        return Tools.get_worker_pool().run(code)
     
     @staticmethod
     def execute_python(code):
         """Execute Python code safely for calculations"""
-        try:
-            # Safe builtins only
-            safe_globals = {
-                '__builtins__': {
-                    'abs': abs, 'min': min, 'max': max, 'sum': sum,
-                    'round': round, 'len': len, 'range': range,
-                    'str': str, 'int': int, 'float': float,
-                    'list': list, 'dict': dict, 'print': print
-                }
-            }
+        return str(Tools.run_python(code))
             
-            # Import safe modules
-            import math
-            safe_globals['math'] = math
-            
-            # Capture output
-            old_stdout = sys.stdout
-            sys.stdout = StringIO()
-            
-            try:
-                # Execute code
-                exec_globals = safe_globals.copy()
-                exec(code, exec_globals)
-                
-                # Get output
-                output = sys.stdout.getvalue()
-                
-                # Try to get result from evaluation
-                if output == "":
-                    result = eval(code, exec_globals)
-                else:
-                    result = output
-                
-                return f"Result: {result}"
-            finally:
-                sys.stdout = old_stdout
-                
-        except Exception as e:
-            if sys.stdout != sys.__stdout__:
-                sys.stdout = sys.__stdout__
-            return f"Error: {str(e)}"
+    @staticmethod
+    def shutdown():
+        """Stop the execute_python workers"""
+        with Tools._pool_lock:
+            if Tools._worker_pool is not None:
+                Tools._worker_pool.close()
+                Tools._worker_pool = None
     
     @staticmethod
-    def process_tool_calls(response, memory, callback_map):
+    def process_tool_calls(response, memory, callback_map, session_id=None):
         """
         Process tool calls in response
         
@@ -77,57 +78,83 @@ Example: TOOL[execute_python](2 + 2)
             response: LLM response text
             memory: Memory instance for learn_fact/learn_procedure
             callback_map: Dict mapping tool names to callbacks
+            session_id: Memory session that learned facts belong to
         
         Returns:
             Cleaned response with tool results appended
         """
-        if "TOOL[" not in response:
-            return response
+        clean_response, results = Tools.run_tool_calls(
+            response, memory, callback_map, session_id
+        )
         
-        import re
-        pattern = r'TOOL\[(\w+)\]\(([^)]+)\)'
-        matches = re.findall(pattern, response)
+        # Append results
+        if results:
+            clean_response += "\n" + "\n".join(results)
         
-        if not matches:
-            return response
+        return clean_response.strip()
+    
+    @staticmethod
+    def run_tool_calls(response, memory, callback_map, session_id=None):
+        """
+        Execute tool calls in response without merging the results back
+        
+        Args:
+            response: LLM response text
+            memory: Memory instance for learn_fact/learn_procedure
+            callback_map: Dict mapping tool names to callbacks
+            session_id: Memory session that learned facts belong to
+        
+        Returns:
+            Tuple of (response with tool calls removed, list of tool results)
+        """
+        clean_response, calls = parse_tool_calls(response)
+        if not calls:
+            return response, []
         
         # Execute tools
         results = []
-        for tool_name, args in matches:
-            if tool_name == "execute_python":
-                result = Tools.execute_python(args)
-                results.append(result)
-            
-            elif tool_name == "learn_fact":
-                if memory and hasattr(memory, 'learn_fact'):
-                    # Parse topic, fact from args
-                    parts = args.split(',', 1)
-                    if len(parts) == 2:
-                        topic = parts[0].strip().strip('"').strip("'")
-                        fact = parts[1].strip().strip('"').strip("'")
-                        result = memory.learn_fact(topic, fact)
-                        results.append(result)
-            
-            elif tool_name == "learn_procedure":
-                if memory and hasattr(memory, 'learn_procedure'):
-                    # Parse name, steps from args
-                    parts = args.split(',', 1)
-                    if len(parts) == 2:
-                        name = parts[0].strip().strip('"').strip("'")
-                        steps = parts[1].strip().strip('"').strip("'")
-                        result = memory.learn_procedure(name, steps)
-                        results.append(result)
-            
-            # Custom callbacks
-            elif tool_name in callback_map:
-                result = callback_map[tool_name](args)
+        for call in calls:
+            result = Tools.run_tool_call(call, memory, callback_map, session_id)
+            if result is not None:
                 results.append(result)
         
-        # Remove tool calls from response
-        clean_response = re.sub(pattern, '', response)
+        return clean_response.strip(), results
+
+    @staticmethod
+    def run_tool_call(call, memory, callback_map, session_id=None):
+        """
+        Execute one parsed tool call
         
-        # Append results
-        if results:
-            clean_response += "\n" + "\n".join(results)
+        Args:
+            call: ToolCall from tool_parser
+            memory: Memory instance for learn_fact/learn_procedure
+            callback_map: Dict mapping tool names to callbacks
+            session_id: Memory session that learned facts belong to
         
-        return clean_response.strip()
+        Returns:
+            Tool result text, or None if the call couldn't be run
+        """
+        if call.name == "execute_python":
+            return Tools.execute_python(call.raw_args)
+        
+        elif call.name == "learn_fact":
+            if memory and hasattr(memory, 'learn_fact'):
+                args = call.arguments(['topic', 'fact'])
+                if args:
+                    topic, fact = (str(arg) for arg in args)
+                    if session_id is not None:
+                        return memory.learn_fact(topic, fact, session_id=session_id)
+                    return memory.learn_fact(topic, fact)
+        
+        elif call.name == "learn_procedure":
+            if memory and hasattr(memory, 'learn_procedure'):
+                args = call.arguments(['name', 'steps'])
+                if args:
+                    name, steps = args
+                    return memory.learn_procedure(str(name), steps)
+        
+        # Custom callbacks
+        elif call.name in callback_map:
+            return callback_map[call.name](call.raw_args)
+        
+        return None
@@ -0,0 +1,274 @@
+"""
+Vector Memory for Gena AI
+Semantic recall over facts and past messages using engine embeddings
+"""
+
+import json
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from memory import DEFAULT_SESSION
+
+
+class VectorStore:
+    """
+    Append-only embedding index stored next to the memory database
+    
+    Files (for path "memory.vectors"):
+        memory.vectors.json  - header (embedding dimension)
+        memory.vectors.f32   - contiguous float32 matrix, one unit-length
+                               row per item, memory-mapped for search
+        memory.vectors.sid   - int32 session code per row
+        memory.vectors.meta  - one JSON line per row (kind, session, key, text)
+    
+    Items are embedded in batches when added (see flush), so a search only
+    embeds the query and does one matrix product over all rows.
+    """
+    
+    def __init__(self, path, embed_fn, batch_size=16):
+        """
+        Args:
+            path: Base path for the index files
+            embed_fn: Callable taking a list of texts and returning a list
+                      of vectors (e.g. engine.embed)
+            batch_size: Pending items that trigger an embedding batch
+        """
+        self.path = Path(path)
+        self.embed_fn = embed_fn
+        self.batch_size = batch_size
+        
+        self.header_file = Path(f"{self.path}.json")
+        self.vectors_file = Path(f"{self.path}.f32")
+        self.sessions_file = Path(f"{self.path}.sid")
+        self.meta_file = Path(f"{self.path}.meta")
+        
+        self.dim = None
+        self.meta = []
+        self.session_codes = {}
+        self._latest = {}  # (kind, session, key) -> newest row
+        self._pending = []
+        self._matrix = None
+        self._codes = None
+        self._lock = threading.RLock()
+        
+        self._load()
+    
+    # ==================== LOADING ====================
+    
+    def _load(self):
+        """Read header and metadata; vectors stay on disk until searched"""
+        if not self.header_file.exists():
+            return
+        
+        with open(self.header_file, 'r', encoding='utf-8') as f:
+            self.dim = json.load(f)['dim']
+        
+        torn = False
+        with open(self.meta_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    self._remember(json.loads(line))
+                except ValueError:
+                    torn = True  # Half-written last line from a crash
+                    break
+        
+        # Rows are only valid if all three files got them; cut off anything
+        # a crash left half-written so later appends stay aligned
+        rows = min(
+            len(self.meta),
+            self.vectors_file.stat().st_size // (self.dim * 4),
+            self.sessions_file.stat().st_size // 4
+        )
+        with open(self.vectors_file, 'r+b') as f:
+            f.truncate(rows * self.dim * 4)
+        with open(self.sessions_file, 'r+b') as f:
+            f.truncate(rows * 4)
+        
+        if torn or rows < len(self.meta):
+            items, self.meta, self._latest = self.meta[:rows], [], {}
+            with open(self.meta_file, 'w', encoding='utf-8') as f:
+                for item in items:
+                    f.write(self._meta_line(item))
+                    self._remember(item)
+    
+    def _remember(self, item):
+        """Track metadata of a stored row"""
+        if item.get('key') is not None:
+            self._latest[(item['kind'], item['session'], item['key'])] = len(self.meta)
+        self.meta.append(item)
+        self._session_code(item['session'])
+    
+    @staticmethod
+    def _meta_line(item):
+        """Serialize one metadata row"""
+        return json.dumps(item, ensure_ascii=False) + "\n"
+    
+    def _session_code(self, session_id):
+        """Small integer for a session id (used to filter rows)"""
+        if session_id not in self.session_codes:
+            self.session_codes[session_id] = len(self.session_codes)
+        return self.session_codes[session_id]
+    
+    # ==================== INDEXING ====================
+    
+    def add(self, kind, text, session_id=DEFAULT_SESSION, key=None, auto_flush=True):
+        """
+        Queue an item for indexing
+        
+        Args:
+            kind: Item type, e.g. 'fact' or 'message'
+            text: Text to embed and return on recall
+            session_id: Session the item belongs to
+            key: Stable id; a newer item with the same kind/session/key
+                 replaces the older one in results
+            auto_flush: Embed the queue once it reaches batch_size (pass
+                        False when called inside a database transaction)
+        """
+        with self._lock:
+            self._pending.append({'kind': kind, 'session': session_id, 'key': key, 'text': text})
+            if auto_flush and len(self._pending) >= self.batch_size:
+                try:
+                    self.flush()
+                except Exception:
+                    pass  # Still queued; embedded by the next flush
+    
+    def flush(self):
+        """
+        Embed all queued items in one batch and append them to disk
+        
+        If embedding fails (endpoint down, timeout) the error is raised
+        and the items stay queued for the next flush.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            items, self._pending = self._pending, []
+            
+            try:
+                vectors = np.asarray(self.embed_fn([item['text'] for item in items]), dtype=np.float32)
+                if self.dim is not None and vectors.shape[1] != self.dim:
+                    raise ValueError(f"Embedding size changed: {vectors.shape[1]} != {self.dim}")
+            except Exception:
+                self._pending[:0] = items
+                raise
+            
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.maximum(norms, 1e-12)
+            
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.header_file, 'w', encoding='utf-8') as f:
+                    json.dump({'dim': self.dim}, f)
+            
+            codes = np.array([self._session_code(item['session']) for item in items], dtype=np.int32)
+            
+            # Vectors first, metadata last: a crash leaves extra bytes
+            # that _load ignores rather than metadata without a vector
+            with open(self.vectors_file, 'ab') as f:
+                f.write(vectors.tobytes())
+            with open(self.sessions_file, 'ab') as f:
+                f.write(codes.tobytes())
+            with open(self.meta_file, 'a', encoding='utf-8') as f:
+                for item in items:
+                    f.write(self._meta_line(item))
+            
+            for item in items:
+                self._remember(item)
+            
+            # Remap on next search
+            self._matrix = None
+            self._codes = None
+    
+    # ==================== SEARCH ====================
+    
+    def _arrays(self):
+        """Memory-mapped (rows x dim) matrix and session codes"""
+        if self._matrix is None and self.meta:
+            rows = len(self.meta)
+            self._matrix = np.memmap(self.vectors_file, dtype=np.float32, mode='r', shape=(rows, self.dim))
+            self._codes = np.memmap(self.sessions_file, dtype=np.int32, mode='r', shape=(rows,))
+        return self._matrix, self._codes
+    
+    def search(self, query, k=3, session_id=None, kinds=None):
+        """
+        Find the stored items most similar to a text
+        
+        Args:
+            query: Text to look up
+            k: Max results
+            session_id: Only return items of this session (None = all)
+            kinds: Only return these kinds (None = all)
+        
+        Returns:
+            List of (score, item) tuples, most similar first
+        """
+        return self.search_many([query], k, session_id, kinds)[0]
+    
+    def search_many(self, queries, k=3, session_id=None, kinds=None):
+        """
+        Batched search: one embedding call and one matrix product for all
+        queries
+        
+        Returns:
+            One result list (as from search) per query
+        """
+        with self._lock:
+            matrix, codes = self._arrays()
+            if matrix is None:
+                return [[] for _ in queries]
+            
+            q = np.asarray(self.embed_fn(list(queries)), dtype=np.float32)
+            q /= np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+            
+            # Cosine similarity of every row to every query: (rows x queries)
+            scores = matrix @ q.T
+            
+            if session_id is not None:
+                code = self.session_codes.get(session_id)
+                if code is None:
+                    return [[] for _ in queries]
+                scores[codes != code] = -np.inf
+            
+            # Over-fetch so superseded or filtered-out rows can be skipped
+            fetch = min(len(scores), k * 4 + 8)
+            top = np.argpartition(-scores, fetch - 1, axis=0)[:fetch]
+            
+            results = []
+            for col in range(len(queries)):
+                rows = top[:, col]
+                rows = rows[np.argsort(-scores[rows, col])]
+                found = []
+                for row in rows:
+                    score = float(scores[row, col])
+                    if score == -np.inf:
+                        break
+                    item = self.meta[row]
+                    key = item.get('key')
+                    if key is not None and self._latest[(item['kind'], item['session'], key)] != row:
+                        continue  # Replaced by a newer version
+                    if kinds and item['kind'] not in kinds:
+                        continue
+                    found.append((score, item))
+                    if len(found) == k:
+                        break
+                results.append(found)
+            return results
+    
+    def __len__(self):
+        return len(self.meta) + len(self._pending)
+    
+    def close(self):
+        """
+        Embed anything still queued and release the mapping
+        
+        Never raises: if embedding fails the items stay queued (and are
+        lost unless flush() is called again), so shutdown can go on.
+        """
+        try:
+            self.flush()
+        except Exception:
+            pass
+        self._matrix = None
+        self._codes = None